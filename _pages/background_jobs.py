@@ -0,0 +1,115 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class BackgroundJob:
+    """
+    A long task running outside the Streamlit script run. The task reports progress through
+    update(), the pages poll status, progress, eta and result. Files the task adds to files are
+    deleted together with the job.
+    """
+
+    def __init__(self, name, owner=""):
+        self.id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.owner = owner
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.files = []
+
+    def update(self, progress=None, message=None):
+        if progress is not None:
+            self.progress = min(1.0, max(0.0, progress))
+        if message is not None:
+            self.message = message
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def eta(self):
+        """Estimated seconds left, extrapolated from the progress so far."""
+        if self.status != "running" or self.progress <= 0:
+            return None
+        return self.elapsed / self.progress * (1 - self.progress)
+
+
+class JobManager:
+    """Process-wide worker pool for background jobs, shared by all sessions."""
+
+    def __init__(self, max_workers=4, keep_seconds=24 * 3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background-job")
+        self.keep_seconds = keep_seconds
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, name, fn, *args, owner="", **kwargs):
+        """Run fn(job, *args, **kwargs) in the pool; its return value becomes job.result."""
+        job = BackgroundJob(name, owner)
+        with self.lock:
+            self._purge()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started = time.time()
+        # finished is set before the status, so a job that is no longer active always has it
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.progress = 1.0
+            job.finished = time.time()
+            job.status = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.finished = time.time()
+            job.status = "failed"
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)
+
+    def has_active(self):
+        return any(job.active for job in self.list())
+
+    def _purge(self):
+        cutoff = time.time() - self.keep_seconds
+        for job_id, job in list(self.jobs.items()):
+            if not job.active and job.finished < cutoff:
+                del self.jobs[job_id]
+                for path in job.files:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
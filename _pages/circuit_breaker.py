@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import deque
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Health of the API for one CEEPS identity, shared by every thread and session that calls it.
+    The outcome of the last `window` requests is kept; when enough of them failed or took longer
+    than slow_seconds the breaker opens and requests fail fast with CircuitOpenError. After
+    open_seconds a single half-open probe is let through, which closes the breaker again or
+    reopens it for twice as long (up to max_open_seconds).
+    """
+
+    def __init__(self, window=20, min_requests=5, failure_rate=0.5, slow_seconds=60.0, open_seconds=30.0,
+                 max_open_seconds=600.0):
+        self.window = window
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.base_open_seconds = open_seconds
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.outcomes = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def before(self):
+        """
+        Call before a request; raises CircuitOpenError while the API is considered down.
+        Returns True when the request is the half-open probe.
+        """
+        with self.lock:
+            if self.state == "closed":
+                return False
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            raise CircuitOpenError(f"API unavailable, retrying in {self.retry_in:.0f} s")
+
+    def record(self, ok, elapsed):
+        """Outcome of a request that was let through by before()."""
+        with self.lock:
+            slow = elapsed >= self.slow_seconds
+            if self.state == "half_open" and self.probing:
+                self.probing = False
+                if ok and not slow:
+                    self._close()
+                else:
+                    self._open(min(self.open_seconds * 2, self.max_open_seconds))
+                return
+
+            self.outcomes.append((ok, elapsed))
+            if self.state == "closed" and len(self.outcomes) >= self.min_requests:
+                if self.error_rate >= self.failure_rate or self.slow_rate >= self.failure_rate:
+                    self._open(self.base_open_seconds)
+
+    def _open(self, seconds):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.open_seconds = seconds
+        self.trips += 1
+        self.changed.notify_all()
+
+    def _close(self):
+        self.state = "closed"
+        self.open_seconds = self.base_open_seconds
+        self.outcomes.clear()
+        self.changed.notify_all()
+
+    def wait_ready(self, timeout):
+        """
+        Block until requests may be sent again, i.e. the breaker is closed or due for a probe.
+        Returns False if that did not happen within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.state != "closed":
+                if self.state == "open":
+                    wait = self.open_seconds - (time.monotonic() - self.opened_at)
+                    if wait <= 0:
+                        return True
+                elif not self.probing:
+                    return True
+                else:
+                    wait = 1.0
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self.changed.wait(min(wait, left))
+            return True
+
+    @property
+    def error_rate(self):
+        return sum(1 for ok, _ in self.outcomes if not ok) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def slow_rate(self):
+        return sum(1 for _, elapsed in self.outcomes if elapsed >= self.slow_seconds) / len(self.outcomes) \
+            if self.outcomes else 0.0
+
+    @property
+    def retry_in(self):
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    @property
+    def status(self):
+        with self.lock:
+            latencies = sorted(elapsed for _, elapsed in self.outcomes)
+            return {
+                "state": self.state,
+                "error_rate": round(self.error_rate, 2),
+                "slow_rate": round(self.slow_rate, 2),
+                "median_latency": round(latencies[len(latencies) // 2], 2) if latencies else 0.0,
+                "retry_in": round(self.retry_in, 1),
+                "trips": self.trips
+            }
+
+
+def get_circuit_breaker(identity):
+    with _breakers_lock:
+        if identity not in _breakers:
+            _breakers[identity] = CircuitBreaker()
+        return _breakers[identity]
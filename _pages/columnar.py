@@ -0,0 +1,178 @@
+import os
+import zipfile
+import tempfile
+import threading
+from zoneinfo import ZoneInfo
+from tempfile import SpooledTemporaryFile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from _pages.readings_io import SPOOL_SIZE, open_payload, iter_meter_readings, quality_code
+
+TIMEZONE = ZoneInfo("Europe/Ljubljana")
+
+SCHEMA = pa.schema([
+    ("usage_point", pa.dictionary(pa.int32(), pa.string())),
+    ("reading_type", pa.dictionary(pa.int8(), pa.string())),
+    ("timestamp", pa.timestamp("s", tz="UTC")),
+    ("value", pa.float64()),
+    ("quality", pa.dictionary(pa.int8(), pa.string()))
+])
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# Rows buffered before they are turned into a record batch
+BATCH_ROWS = 256 * 1024
+
+
+class ColumnarBuilder:
+    """
+    Long table of the retrieved readings (usage_point, reading_type, timestamp, value, quality)
+    collected while the chunks arrive and written as Parquet or Arrow IPC, optionally one file per month.
+    """
+
+    def __init__(self, format="parquet", partition_by_month=False):
+        self.format = format
+        self.partition_by_month = partition_by_month
+        self.batches = []
+        # Retrievals for several identities add to the same table from their own threads
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.usage_points = []
+        self.reading_types = []
+        self.timestamps = []
+        self.values = []
+        self.qualities = []
+
+    def add_meter_reading(self, meter_reading):
+        usage_point = meter_reading["usagePoint"]
+        with self.lock:
+            for interval_block in meter_reading.get("intervalBlocks", []):
+                interval_readings = interval_block.get("intervalReadings", [])
+                self.usage_points += [usage_point] * len(interval_readings)
+                self.reading_types += [interval_block.get("readingType")] * len(interval_readings)
+                self.timestamps += [reading["timestamp"] for reading in interval_readings]
+                self.values += [reading.get("value") for reading in interval_readings]
+                self.qualities += [quality_code(reading) for reading in interval_readings]
+            if len(self.timestamps) >= BATCH_ROWS:
+                self._flush()
+
+    def add_payload(self, payload):
+        for meter_reading in payload.get("meterReadings", []):
+            self.add_meter_reading(meter_reading)
+
+    def add_path(self, path):
+        with open_payload(path) as f:
+            for meter_reading in iter_meter_readings(f):
+                self.add_meter_reading(meter_reading)
+
+    def _flush(self):
+        if not self.timestamps:
+            return
+        # One vectorised parse of the ISO timestamps (with their offsets) per batch
+        epoch = pd.to_datetime(self.timestamps, utc=True, format="ISO8601").as_unit("s").asi8
+        self.batches.append(pa.record_batch([
+            pa.array(self.usage_points, pa.string()).dictionary_encode(),
+            pa.array(self.reading_types, pa.string()).dictionary_encode().cast(SCHEMA.field("reading_type").type),
+            pa.array(epoch, SCHEMA.field("timestamp").type),
+            pa.array(np.array(self.values, dtype=np.float64)),
+            pa.array(self.qualities, pa.string()).dictionary_encode().cast(SCHEMA.field("quality").type)
+        ], schema=SCHEMA))
+        self._reset()
+
+    def table(self):
+        with self.lock:
+            self._flush()
+        return pa.Table.from_batches(self.batches, schema=SCHEMA).unify_dictionaries().combine_chunks()
+
+    def write(self, path):
+        """Write to path, a file, or with partition_by_month a directory with month=YYYY-MM subdirectories."""
+        table = self.table()
+        if not self.partition_by_month:
+            write_table(table, path, self.format)
+            return path
+
+        months = month_column(table)
+        for month in sorted(set(months.to_pylist())):
+            directory = os.path.join(path, f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            part = table.filter(pc.equal(months, month))
+            write_table(part, os.path.join(directory, f"part-0{FORMATS[self.format]}"), self.format)
+        return path
+
+    def close(self):
+        """The output as a file object: the file itself, or a ZIP of the month directories."""
+        output = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        if not self.partition_by_month:
+            write_table(self.table(), output, self.format)
+        else:
+            with tempfile.TemporaryDirectory() as directory, zipfile.ZipFile(output, "w") as zip_file:
+                # Parquet and Arrow are already compressed, the ZIP only bundles the files
+                self.write(directory)
+                for root, _, files in os.walk(directory):
+                    for name in files:
+                        full_path = os.path.join(root, name)
+                        zip_file.write(full_path, os.path.relpath(full_path, directory))
+        self.batches = []
+        output.seek(0)
+        return output
+
+
+def month_column(table):
+    # Timestamps mark the end of an interval, so 00:00 on the first belongs to the previous month
+    local = pd.to_datetime(table.column("timestamp").to_numpy() - np.timedelta64(1, "s"), utc=True)
+    return pa.array(local.tz_convert(TIMEZONE).strftime("%Y-%m"))
+
+
+def month_bounds(month):
+    """UTC start and end of a local month ('2026-09'); its intervals end after start and up to end."""
+    start = pd.Timestamp(f"{month}-01").tz_localize(TIMEZONE)
+    return start.tz_convert("UTC"), (start + pd.DateOffset(months=1)).tz_convert("UTC")
+
+
+def write_table(table, where, format="parquet"):
+    if format == "parquet":
+        pq.write_table(table, where, compression="zstd")
+        return
+    sink = pa.OSFile(where, "wb") if isinstance(where, str) else pa.PythonFile(where, mode="w")
+    with ipc.new_file(sink, table.schema, options=ipc.IpcWriteOptions(compression="zstd")) as writer:
+        writer.write_table(table)
+    if isinstance(where, str):
+        sink.close()
+
+
+def read_readings(path, month=None, usage_points=None):
+    """
+    Load a written table, a single file or a month-partitioned directory, as a DataFrame.
+    month ('2026-09') and usage_points only read the matching partitions and rows; without month
+    partitions the month is filtered on the timestamps.
+    """
+    format = "ipc" if path.endswith(".arrow") or _partition_suffix(path) == ".arrow" else "parquet"
+    dataset = ds.dataset(path, format=format, partitioning="hive")
+
+    expression = None
+    if month is not None and "month" in dataset.schema.names:
+        expression = ds.field("month") == month
+    elif month is not None:
+        # A single file: the same intervals as month_column, by their end timestamp
+        start, end = month_bounds(month)
+        expression = (ds.field("timestamp") > pa.scalar(start, SCHEMA.field("timestamp").type)) & \
+            (ds.field("timestamp") <= pa.scalar(end, SCHEMA.field("timestamp").type))
+    if usage_points is not None:
+        condition = ds.field("usage_point").isin(list(usage_points))
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(filter=expression).to_pandas()
+
+
+def _partition_suffix(path):
+    if os.path.isdir(path):
+        for _, _, files in os.walk(path):
+            for name in files:
+                return os.path.splitext(name)[1]
+    return None
@@ -0,0 +1,463 @@
+import os
+import json
+import zipfile
+import hashlib
+import threading
+import traceback
+from io import BytesIO
+from itertools import repeat
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+import numpy as np
+from pandas import DataFrame, read_excel, MultiIndex, concat, ExcelWriter, isna, \
+    DatetimeIndex
+from _pages.readings_io import open_payload, iter_meter_readings
+
+distribucije = {
+    2: "2_Elektro_Celje",
+    3: "3_Elektro_Ljubljana",
+    4: "4_Elektro_Maribor",
+    6: "6_Elektro_Gorenjska",
+    7: "7_Elektro_Primorska"
+}
+
+TIMEZONE = ZoneInfo("Europe/Ljubljana")
+
+# Length of an interval reading; timestamps on the grid are whole multiples of it since the epoch
+SLOT_SECONDS = 15 * 60
+
+# Processes parsing uploaded JSON files. Starting one (and importing pandas in it) takes about as long
+# as parsing 32 MB of JSON, so every worker gets at least that much and small uploads are parsed inline.
+PARSE_WORKERS = min(8, os.cpu_count() or 1)
+WORKER_MIN_BYTES = 32 * 1024 * 1024
+
+# Metering point index of the last few mapping files, by the hash of their content
+_mt_dist_indexes = {}
+_mt_dist_lock = threading.Lock()
+
+
+def read_mt_dist(mt_dist_file):
+    dobava_mt_df = read_excel(mt_dist_file, sheet_name='dobava')
+    odkup_mt_df = read_excel(mt_dist_file, sheet_name='odkup')
+    podpora_mt_df = read_excel(mt_dist_file, sheet_name='obratovalna_podpora')
+
+    dobava_mt_df['merilna_tocka'] = dobava_mt_df['merilna_tocka'].astype(str)
+    odkup_mt_df['merilna_tocka'] = odkup_mt_df['merilna_tocka'].astype(str)
+    podpora_mt_df['merilna_tocka'] = podpora_mt_df['merilna_tocka'].astype(str)
+
+    return dobava_mt_df, odkup_mt_df, podpora_mt_df
+
+
+def build_mt_dist_index(dobava_mt_df, odkup_mt_df, podpora_mt_df):
+    """
+    One table indexed by merilna_tocka with distribucija, tip and naziv_placnika.
+    A metering point listed more than once keeps its first row, in the order dobava, odkup, podpora.
+    """
+    df_dict = {"dobava": dobava_mt_df, "odkup": odkup_mt_df, "podpora": podpora_mt_df}
+    mt_dist = concat([df[['merilna_tocka', 'distribucija', 'naziv_placnika']].assign(tip=tip)
+                      for tip, df in df_dict.items()], ignore_index=True)
+    return mt_dist.drop_duplicates('merilna_tocka').set_index('merilna_tocka')[['distribucija', 'tip',
+                                                                                 'naziv_placnika']]
+
+
+def _file_bytes(mt_dist_file):
+    if isinstance(mt_dist_file, (str, os.PathLike)):
+        with open(mt_dist_file, "rb") as f:
+            return f.read()
+    if hasattr(mt_dist_file, "getvalue"):
+        return mt_dist_file.getvalue()
+    position = mt_dist_file.tell()
+    data = mt_dist_file.read()
+    mt_dist_file.seek(position)
+    return data
+
+
+def get_mt_dist_index(mt_dist_file):
+    """build_mt_dist_index of a mapping file, read and built only once per file content."""
+    data = _file_bytes(mt_dist_file)
+    digest = hashlib.sha256(data).hexdigest()
+    with _mt_dist_lock:
+        mt_dist = _mt_dist_indexes.get(digest)
+    if mt_dist is None:
+        mt_dist = build_mt_dist_index(*read_mt_dist(BytesIO(data)))
+        with _mt_dist_lock:
+            _mt_dist_indexes[digest] = mt_dist
+            while len(_mt_dist_indexes) > 8:
+                _mt_dist_indexes.pop(next(iter(_mt_dist_indexes)))
+    return mt_dist
+
+
+@lru_cache(maxsize=256)
+def grid_index(first_slot, count):
+    """
+    Local time index of count 15-minute slots from first_slot (epoch seconds // SLOT_SECONDS).
+    Cached, so every meter on the same grid shares one index object.
+    """
+    epochs = (np.arange(first_slot, first_slot + count, dtype=np.int64) * SLOT_SECONDS).astype('datetime64[s]')
+    utc = DatetimeIndex(epochs.astype('datetime64[ns]'), tz='UTC')
+    return DatetimeIndex(utc.tz_convert(TIMEZONE).tz_localize(None), name='timestamp')
+
+
+@lru_cache(maxsize=1024)
+def _grid_slot(first_timestamp, last_timestamp, count):
+    # First slot of count readings from first_timestamp to last_timestamp, None if they are not on the grid
+    first = datetime.fromisoformat(first_timestamp)
+    last = datetime.fromisoformat(last_timestamp)
+    if first.tzinfo is None or last.tzinfo is None:
+        return None
+    first_epoch = int(first.timestamp())
+    if first_epoch % SLOT_SECONDS or int(last.timestamp()) - first_epoch != (count - 1) * SLOT_SECONDS:
+        return None
+    return first_epoch // SLOT_SECONDS
+
+
+def time_axis(interval_readings):
+    """
+    (grid_index, first_slot) of interval readings that lie on the 15-minute grid, or None.
+    Only the first and last timestamps are parsed; a few in between are compared with the grid
+    to confirm that it matches.
+    """
+    count = len(interval_readings)
+    first_slot = _grid_slot(interval_readings[0]['timestamp'], interval_readings[-1]['timestamp'], count)
+    if first_slot is None:
+        return None
+    index = grid_index(first_slot, count)
+    for position in (count // 4, count // 2, 3 * count // 4):
+        if np.datetime64(interval_readings[position]['timestamp'][:19]) != index.values[position]:
+            return None
+    return index, first_slot
+
+
+def _slots_contiguous(dataframes):
+    # Whether the slot ranges of the meters overlap or touch, so their union has no gaps the grid would fill
+    ranges = sorted((df.attrs['first_slot'], df.attrs['first_slot'] + len(df)) for df in dataframes)
+    end = ranges[0][1]
+    for first, last in ranges[1:]:
+        if first > end:
+            return False
+        end = max(end, last)
+    return True
+
+
+def _assemble_on_grid(by_column):
+    # Every meter is a slice of one canonical grid: place it by its slot offset, no union or lookup
+    dataframes = [df for frames in by_column.values() for df in frames]
+    first = min(df.attrs['first_slot'] for df in dataframes)
+    last = max(df.attrs['first_slot'] + len(df) for df in dataframes)
+
+    # One layer per frame of a meter (its reading types), summed in the same order as the union would
+    layers = []
+    for i, frames in enumerate(by_column.values()):
+        for layer, df in enumerate(frames):
+            if layer == len(layers):
+                layers.append(np.full((last - first, len(by_column)), np.nan))
+            offset = df.attrs['first_slot'] - first
+            layers[layer][offset:offset + len(df), i] = df.iloc[:, 0].to_numpy(dtype=float)
+
+    index = grid_index(first, last - first)
+    df = DataFrame(np.concatenate(layers) if len(layers) > 1 else layers[0],
+                   index=index.append([index] * (len(layers) - 1)) if len(layers) > 1 else index,
+                   columns=MultiIndex.from_tuples(list(by_column)))
+    if not df.index.is_unique:
+        # Several reading types, or the hour repeated in local time when DST ends
+        df = df.groupby(level=0).sum(min_count=1)
+    return df
+
+
+def assemble_dist_df(dataframes):
+    """
+    One wide frame of the single-column meter frames of a distribution, aligned on the sorted union
+    of their timestamps. Frames of the same meter, and repeated timestamps within a meter
+    (the DST change in local time), are summed first, like the groupby in write_distributions would.
+    """
+    by_column = {}
+    for df in dataframes:
+        by_column.setdefault(df.columns[0], []).append(df)
+
+    if all('first_slot' in df.attrs for df in dataframes) and _slots_contiguous(dataframes):
+        return _assemble_on_grid(by_column)
+
+    columns = []
+    for frames in by_column.values():
+        df = frames[0] if len(frames) == 1 else concat(frames)
+        if not df.index.is_unique:
+            df = df.groupby(level=0).sum()
+        columns.append(df)
+
+    # Fill one preallocated block, so memory is a single rows x meters array and stays unfragmented
+    index = DatetimeIndex(np.unique(np.concatenate([df.index.values for df in columns])), name='timestamp')
+    values = np.full((len(index), len(columns)), np.nan)
+    for i, df in enumerate(columns):
+        values[index.get_indexer(df.index), i] = df.iloc[:, 0].to_numpy(dtype=float)
+
+    return DataFrame(values, index=index, columns=MultiIndex.from_tuples(list(by_column)))
+
+
+def merge_to_dist_dfs(dataframes, mt_dist_file):
+    collected = {
+        "dobava": {2: [], 3: [], 4: [], 6: [], 7: []},
+        "odkup": {2: [], 3: [], 4: [], 6: [], 7: []},
+        "podpora": {2: [], 3: [], 4: [], 6: [], 7: []}
+    }
+
+    # Resolve every metering point at once with a join on the index of the mapping
+    metering_points = [df.columns[0] for df in dataframes]  # Get column name that is MT
+    resolved = get_mt_dist_index(mt_dist_file).reindex(metering_points)
+
+    for df, metering_point, (dist, tip, naziv_placnika) in zip(dataframes, metering_points,
+                                                               resolved.itertuples(index=False)):
+        if isna(dist):
+            print("INFO: Could not find distribution for " + metering_point + ".")
+            continue
+
+        df.columns = MultiIndex.from_tuples([(naziv_placnika, df.columns[0])])
+        collected[tip][int(dist)].append(df)
+
+    # Each distribution is put together once, instead of re-concatenating and re-sorting per meter
+    df_dict_dobava, df_dict_odkup, df_dict_podpora = (
+        {dist: assemble_dist_df(frames) if frames else DataFrame() for dist, frames in collected[tip].items()}
+        for tip in ("dobava", "odkup", "podpora")
+    )
+    return df_dict_dobava, df_dict_odkup, df_dict_podpora
+
+
+def decode_interval_readings(interval_readings):
+    """
+    (values, first_slot, timestamps) of interval readings as plain arrays: first_slot when they are on
+    the 15-minute grid, otherwise their local timestamps as datetime64[s] with first_slot None.
+    """
+    count = len(interval_readings)
+    # Straight into arrays instead of a dict per reading through json_normalize. The timestamps are
+    # kept in local time like before, by parsing them without their UTC offset in one call.
+    values = np.fromiter((reading.get('value', np.nan) for reading in interval_readings), dtype=float, count=count)
+    axis = time_axis(interval_readings) if count else None
+    if axis is not None:
+        # On the 15-minute grid: the slot is enough, every timestamp need not be parsed
+        return values, axis[1], None
+
+    try:
+        timestamps = np.array([reading['timestamp'][:19] for reading in interval_readings], dtype='datetime64[s]')
+    except ValueError:
+        # Not in the usual YYYY-MM-DDTHH:MM:SS+hh:mm form
+        timestamps = np.array([datetime.fromisoformat(reading['timestamp']).replace(tzinfo=None)
+                               for reading in interval_readings], dtype='datetime64[s]')
+    return values, None, timestamps
+
+
+def frame_from_arrays(usage_point, message_created, values, first_slot, timestamps):
+    """The meter frame of decode_interval_readings; meters on the grid share the cached index."""
+    if first_slot is not None:
+        df = DataFrame({usage_point: values}, index=grid_index(first_slot, len(values)))
+        df.attrs['first_slot'] = first_slot
+    else:
+        df = DataFrame({usage_point: values},
+                       index=DatetimeIndex(timestamps.astype('datetime64[ns]'), name='timestamp'))
+    # df.attrs['messageType'] = meter_reading['messageType']
+    df.attrs['messageCreated'] = message_created
+    return df
+
+
+def _check_missing(meter_reading, interval_readings, missing_data):
+    if missing_data is not None:
+        for reading in interval_readings:
+            if reading.get('readingQualities'):
+                missing_data.append(meter_reading['usagePoint'])
+                break
+
+
+def create_df_from_mq_json(meter_reading, interval_readings, missing_data=None):
+    _check_missing(meter_reading, interval_readings, missing_data)
+    return frame_from_arrays(meter_reading['usagePoint'], meter_reading['messageCreated'],
+                             *decode_interval_readings(interval_readings))
+
+
+def iter_mq_interval_readings(meter_readings, log=print):
+    """(meter_reading, interval_readings) of the first interval block of each meter reading of an API response."""
+    for meter_reading in meter_readings:
+        try:
+            interval_readings = meter_reading['intervalBlocks'][0]['intervalReadings']
+        except IndexError:
+            log("INFO: Empty interval readings for " + meter_reading['usagePoint'] + ".")
+            continue
+        yield meter_reading, interval_readings
+
+
+def iter_ceeps_interval_readings(meter_reading, log=print):
+    """(meter_reading, interval_readings) of every interval block of a CEEPS meter reading."""
+    for idx, intervalBlock in enumerate(meter_reading['intervalBlocks']):
+        try:
+            interval_readings = meter_reading['intervalBlocks'][idx]['intervalReadings']
+        except IndexError:
+            log("INFO: Empty interval readings for " + meter_reading['usagePoint'] + ".")
+            continue
+        # Use code from MQ because it is the same from this point forward
+        yield meter_reading, interval_readings
+
+
+def get_dataframes_meter_readings(meter_readings, missing_data=None, log=print):
+    """DataFrames of the first interval block of each meter reading of an API response."""
+    return [create_df_from_mq_json(meter_reading, interval_readings, missing_data)
+            for meter_reading, interval_readings in iter_mq_interval_readings(meter_readings, log)]
+
+
+def get_dataframes_mq_json(readings, missing_data=None, log=print):
+    dataframes = []
+    for data in readings.values():
+        dataframes += get_dataframes_meter_readings(data['meterReadings'], missing_data, log)
+    return dataframes
+
+
+def get_dataframes_ceeps_json(readings, missing_data=None, log=print):
+    dataframes = []
+    for meter_reading in readings.values():
+        dataframes += [create_df_from_mq_json(meter_reading, interval_readings, missing_data)
+                       for meter_reading, interval_readings in iter_ceeps_interval_readings(meter_reading, log)]
+    return dataframes
+
+
+def decode_json_file(content, filetype):
+    """
+    Meters of one uploaded CEEPS or MQ file as (usage_point, messageCreated, values, first_slot, timestamps)
+    tuples of plain arrays, with its missing data and log messages. Runs in the worker processes of
+    get_dataframes_json_files, so only the arrays are pickled back and not whole DataFrames.
+    """
+    data = json.loads(content)
+    missing_data, messages = [], []
+    if filetype == "CEEPS":
+        blocks = iter_ceeps_interval_readings(data, messages.append)
+    else:
+        blocks = iter_mq_interval_readings(data['meterReadings'], messages.append)
+
+    meters = []
+    for meter_reading, interval_readings in blocks:
+        _check_missing(meter_reading, interval_readings, missing_data)
+        meters.append((meter_reading['usagePoint'], meter_reading['messageCreated'],
+                       *decode_interval_readings(interval_readings)))
+    return meters, missing_data, messages
+
+
+def get_dataframes_json_files(contents, filetype, missing_data=None, log=print, max_workers=PARSE_WORKERS):
+    """
+    DataFrames of the meters of uploaded JSON files (their bytes), like get_dataframes_ceeps_json and
+    get_dataframes_mq_json but with the files parsed and decoded in a pool of processes once the
+    upload is large enough to be worth starting them.
+    """
+    contents = list(contents)
+    workers = min(max_workers, len(contents), sum(len(content) for content in contents) // WORKER_MIN_BYTES)
+    if workers <= 1:
+        results = (decode_json_file(content, filetype) for content in contents)
+        return _collect_json_files(results, missing_data, log)
+
+    # Spawned rather than forked, as the Streamlit server runs its own threads
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+        results = executor.map(decode_json_file, contents, repeat(filetype),
+                               chunksize=max(1, len(contents) // (workers * 4)))
+        return _collect_json_files(results, missing_data, log)
+
+
+def _collect_json_files(results, missing_data, log):
+    dataframes = []
+    for meters, file_missing_data, messages in results:
+        for message in messages:
+            log(message)
+        if missing_data is not None:
+            missing_data += file_missing_data
+        dataframes += [frame_from_arrays(*meter) for meter in meters]
+    return dataframes
+
+
+def write_distributions(df_dict_dobava, df_dict_odkup, df_dict_podpora):
+    """ZIP with one workbook per type of usage point and one sheet per distribution."""
+    # Initialize a BytesIO object for the zip file
+    zip_io = BytesIO()
+
+    # Initialize a ZipFile object
+    with zipfile.ZipFile(zip_io, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        data_and_names = [
+            (df_dict_dobava, 'Odjem.xlsx'),
+            (df_dict_odkup, 'Oddaja.xlsx'),
+            (df_dict_podpora, 'Obratovalna_podpora.xlsx')
+        ]
+
+        for df_dict, excel_filename in data_and_names:
+            if all(df.empty for df in df_dict.values()):
+                continue
+
+            try:
+                output = BytesIO()
+
+                with ExcelWriter(output, engine='xlsxwriter') as writer:
+                    for key in df_dict:
+                        if df_dict[key].empty:
+                            continue
+
+                        # Sort columns and group by 'timestamp'
+                        df_dict[key] = df_dict[key].reindex(sorted(df_dict[key].columns), axis=1)
+                        df_dict[key] = df_dict[key].groupby('timestamp').sum().reset_index(col_level=1)
+
+                        sheet_name = distribucije[key]
+
+                        # Write each key as a separate sheet in the Excel file
+                        df_dict[key].to_excel(writer, sheet_name=sheet_name)
+
+                        writer.sheets[sheet_name].set_row(2, None, None, {'hidden': True})
+
+                        writer.sheets[sheet_name].autofit()
+                        writer.sheets[sheet_name].set_column_pixels(1, 1, 130)
+
+                        writer.sheets[sheet_name].set_selection(3, 2, 3, 2)
+
+                output.seek(0)
+
+                # Add the Excel file to the zip file
+                zip_file.writestr(excel_filename, output.getvalue())
+
+            except Exception as e:
+                traceback.print_exc()
+                print(f"ERROR - Could not write: {excel_filename}")
+
+    # Move the file pointer of the zip file back to the start
+    zip_io.seek(0)
+    return zip_io
+
+
+class DistributionBuilder:
+    """
+    Collects the meter readings of a retrieval while the chunks arrive and writes the
+    distribution workbooks at the end, without going through the downloaded JSON or ZIP.
+    """
+
+    def __init__(self, mt_dist_file):
+        self.mt_dist_file = mt_dist_file
+        self.dataframes = []
+        self.missing_data = []
+        self.empty = []
+        self.lock = threading.Lock()
+
+    def add_meter_readings(self, meter_readings):
+        missing_data, empty = [], []
+        # Every interval block, like the ZIP's per usage point files uploaded to json_dist as CEEPS JSON
+        dataframes = [create_df_from_mq_json(meter_reading, interval_readings, missing_data)
+                      for entry in meter_readings
+                      for meter_reading, interval_readings in iter_ceeps_interval_readings(entry, empty.append)]
+        with self.lock:
+            self.dataframes += dataframes
+            self.missing_data += missing_data
+            self.empty += empty
+
+    def add_payload(self, payload):
+        self.add_meter_readings(payload.get("meterReadings", []))
+
+    def add_path(self, path):
+        # Checkpointed chunks (resumed or streamed) are read back one meter reading at a time
+        with open_payload(path) as f:
+            self.add_meter_readings(iter_meter_readings(f))
+
+    def close(self):
+        """The ZIP of the workbooks as a BytesIO."""
+        df_dict_dobava, df_dict_odkup, df_dict_podpora = merge_to_dist_dfs(self.dataframes, self.mt_dist_file)
+        self.dataframes = []
+        return write_distributions(df_dict_dobava, df_dict_odkup, df_dict_podpora)
@@ -0,0 +1,102 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from _pages import telemetry
+from _pages.rate_limiter import retry_after_seconds
+from _pages.circuit_breaker import CircuitOpenError
+
+BASE_URL = "https://api.informatika.si/enotna-vstopna-tocka/merilni-podatki/meter-readings"
+
+# Name of the secret holding the encoded credentials of each CEEPS identity
+SECRETS = {
+    "NME": "encoded_string_nme",
+    "SFA": "encoded_string_sfa"
+}
+
+MESSAGE_TYPES = {
+    'Daily 15 minute': 'D1_15MIN',
+    'Monthly 15 minute': 'M1_15MIN'
+}
+
+
+def build_url(message_type, usage_points_chunk, start_date="", end_date="", base_url=BASE_URL):
+    if message_type in MESSAGE_TYPES:
+        base_url += f'?messageType={MESSAGE_TYPES[message_type]}'
+    elif message_type == 'Specify date':
+        base_url += f'?startTime={start_date}&endTime={end_date}'
+
+    usage_points_str = '&'.join(f"usagePoints={point}" for point in usage_points_chunk)
+    return f"{base_url}&{usage_points_str}"
+
+
+class InformatikaClient:
+    """
+    Meter-readings client for one CEEPS identity.
+    Keeps a pooled keep-alive session with the auth headers already set, so it can be shared
+    by all chunks (and threads) of a retrieval instead of opening a new connection per chunk.
+    Requests beyond pool_size at a time open connections that are closed again after use.
+    """
+
+    def __init__(self, encoded_string, identity="", pool_size=16, base_url=BASE_URL, rate_limiter=None,
+                 max_throttled_retries=3, circuit_breaker=None):
+        self.identity = identity
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_throttled_retries = max_throttled_retries
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update({
+            'accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            'Authorization': f'Basic {encoded_string}'
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get_meter_readings(self, message_type, usage_points_chunk, start_date="", end_date="", timeout=None,
+                           stream=False):
+        url = build_url(message_type, usage_points_chunk, start_date, end_date, self.base_url)
+        if self.circuit_breaker is None:
+            return self._get(url, timeout, stream)
+
+        # Raises CircuitOpenError while the API is down. Timeouts, connection errors and 5xx count
+        # as failures; the latency is the time to the response headers, without rate limiter waits.
+        probe = self.circuit_breaker.before()
+        start = time.perf_counter()
+        try:
+            response = self._get(url, timeout, stream)
+        except Exception as e:
+            self.circuit_breaker.record(False, time.perf_counter() - start)
+            if probe:
+                # The breaker is open again: the chunk waits for the next probe instead of being split
+                raise CircuitOpenError(f"API still unavailable, probe failed: {e}") from e
+            raise
+
+        ok = response.status_code < 500
+        self.circuit_breaker.record(ok, response.elapsed.total_seconds())
+        if probe and not ok:
+            raise CircuitOpenError(f"API still unavailable, probe returned {response.status_code}")
+        return response
+
+    def _get(self, url, timeout, stream):
+        if self.rate_limiter is None:
+            return self.session.get(url, timeout=timeout, stream=stream)
+
+        # On 429 the whole identity backs off for Retry-After, then the request is sent again.
+        # The last response is returned unread, so the caller can still look at it.
+        for attempt in range(self.max_throttled_retries):
+            self.rate_limiter.acquire()
+            response = self.session.get(url, timeout=timeout, stream=stream)
+            if response.status_code != 429:
+                return response
+            self.rate_limiter.pause(retry_after_seconds(response.headers.get('Retry-After')))
+            if attempt + 1 == self.max_throttled_retries:
+                return response
+            response.close()
+            telemetry.add(retries=1)
+
+    def close(self):
+        self.session.close()
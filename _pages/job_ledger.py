@@ -0,0 +1,124 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import sqlite3
+import threading
+import hashlib
+from datetime import date
+
+# Local directory for retrieval state (job ledger, cached payloads)
+DATA_DIR = os.environ.get("NME_DATA_DIR", os.path.join(os.path.expanduser("~"), ".nme_data"))
+
+
+def job_id(ceeps_id, message_type, start_date, end_date, usage_points):
+    """
+    Identity of a retrieval job. Daily and monthly pulls have no explicit range,
+    so they are keyed by the day they run on.
+    """
+    if message_type != 'Specify date':
+        start_date, end_date = date.today(), ""
+    usage_points_hash = hashlib.sha256("\n".join(usage_points).encode()).hexdigest()
+    key = f"{ceeps_id}|{message_type}|{start_date}|{end_date}|{usage_points_hash}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class JobLedger:
+    """
+    On-disk checkpoint of retrieval jobs: a SQLite table with the status of every finished chunk
+    and one gzip-compressed JSON file per successful chunk payload.
+    A rerun of the same job only has to fetch the usage points that are not in a successful chunk.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.jobs_dir = os.path.join(data_dir, "jobs")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        # One connection shared by the sessions and background jobs, serialised by the lock
+        self.conn = sqlite3.connect(os.path.join(data_dir, "jobs.sqlite"), check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                usage_points TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                path TEXT,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_job_id ON chunks (job_id);
+        """)
+        self.conn.commit()
+
+    def record(self, job, usage_points, payload):
+        path = self._payload_path(job)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        self._record_done(job, usage_points, path)
+        return path
+
+    def record_stream(self, job, usage_points, fileobj):
+        """Like record, but copies an undecoded response body from a binary file object."""
+        path = self._payload_path(job)
+        with gzip.open(path, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        self._record_done(job, usage_points, path)
+        return path
+
+    def _payload_path(self, job):
+        os.makedirs(os.path.join(self.jobs_dir, job), exist_ok=True)
+        return os.path.join(self.jobs_dir, job, f"{time.time_ns()}.json.gz")
+
+    def _record_done(self, job, usage_points, path):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO chunks (job_id, usage_points, status, path, created) VALUES (?, ?, 'done', ?, ?)",
+                (job, json.dumps(usage_points), path, time.time())
+            )
+            self.conn.commit()
+
+    def record_error(self, job, usage_points, error):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO chunks (job_id, usage_points, status, error, created) VALUES (?, ?, 'error', ?, ?)",
+                (job, json.dumps(usage_points), error, time.time())
+            )
+            self.conn.commit()
+
+    def completed_points(self, job):
+        with self.lock:
+            rows = self.conn.execute("SELECT usage_points FROM chunks WHERE job_id = ? AND status = 'done'",
+                                     (job,)).fetchall()
+        return {point for (points,) in rows for point in json.loads(points)}
+
+    def missing_points(self, job, usage_points):
+        completed = self.completed_points(job)
+        return [point for point in usage_points if point not in completed]
+
+    def payload_paths(self, job):
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM chunks WHERE job_id = ? AND status = 'done' ORDER BY id",
+                                     (job,)).fetchall()
+        return [path for (path,) in rows]
+
+    def reset(self, job):
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM chunks WHERE job_id = ? AND path IS NOT NULL",
+                                     (job,)).fetchall()
+            self.conn.execute("DELETE FROM chunks WHERE job_id = ?", (job,))
+            self.conn.commit()
+        for (path,) in rows:
+            if os.path.exists(path):
+                os.remove(path)
+        job_dir = os.path.join(self.jobs_dir, job)
+        if os.path.isdir(job_dir) and not os.listdir(job_dir):
+            os.rmdir(job_dir)
+
+    def purge(self, max_age_days=14):
+        cutoff = time.time() - max_age_days * 86400
+        with self.lock:
+            jobs = self.conn.execute("SELECT job_id FROM chunks GROUP BY job_id HAVING MAX(created) < ?",
+                                     (cutoff,)).fetchall()
+        for (job,) in jobs:
+            self.reset(job)
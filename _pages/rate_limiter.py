@@ -0,0 +1,90 @@
+import time
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Requests per second and burst size allowed for each CEEPS identity
+RATE_LIMITS = {
+    "NME": (5.0, 10),
+    "SFA": (5.0, 10)
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every thread and session that calls the API with the same credentials.
+    acquire() blocks until a token is available; pause() stops handing out tokens, e.g. after a 429.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        with self.lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self.paused_until:
+                        delay = self.paused_until - now
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    else:
+                        delay = (1 - self._tokens) / self.rate
+                time.sleep(delay)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    @property
+    def tokens(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    @property
+    def status(self):
+        paused = max(0.0, self.paused_until - time.monotonic())
+        return {"tokens": round(self.tokens, 1), "queue_depth": self.waiting, "paused_seconds": round(paused, 1)}
+
+
+def get_rate_limiter(identity):
+    with _limiters_lock:
+        if identity not in _limiters:
+            _limiters[identity] = TokenBucket(*RATE_LIMITS.get(identity, (5.0, 10)))
+        return _limiters[identity]
+
+
+def retry_after_seconds(value, default=30.0):
+    """Parse a Retry-After header, given either in seconds or as an HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,196 @@
+import io
+import sys
+import gzip
+import json
+import time
+import zlib
+import shutil
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+# Responses and archives up to this size stay in memory, larger ones spill to a temp file
+SPOOL_SIZE = 8 * 1024 * 1024
+
+
+def spool_response(response, chunk_size=65536):
+    """Copy a streamed response body (already gzip-decoded) to a spooled temp file."""
+    spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    for data in response.iter_content(chunk_size=chunk_size):
+        spool.write(data)
+    spool.seek(0)
+    return spool
+
+
+def iter_meter_readings(fileobj, read_size=65536):
+    """
+    Yield the entries of the top-level "meterReadings" array of a response one at a time,
+    so only a single meter reading is held in memory. fileobj is a text file object.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    while True:
+        key = buffer.find('"meterReadings"')
+        start = buffer.find('[', key) if key >= 0 else -1
+        if start >= 0:
+            buffer = buffer[start + 1:]
+            break
+        if eof:
+            return
+        if key < 0:
+            buffer = buffer[-len('"meterReadings"'):]
+        data = fileobj.read(read_size)
+        eof = not data
+        buffer += data
+
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                meter_reading, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield meter_reading
+                buffer = buffer[end:]
+                continue
+        if eof:
+            return
+        data = fileobj.read(read_size)
+        eof = not data
+        buffer += data
+
+
+def quality_code(reading):
+    """readingQualityType of an interval reading, None when it has no quality flag."""
+    qualities = reading.get("readingQualities") or []
+    return qualities[0].get("readingQualityType") if qualities else None
+
+
+def open_payload(path):
+    return gzip.open(path, "rt", encoding="utf-8")
+
+
+def deflate_member(filename, data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    return filename, zlib.crc32(data), len(data), compressed
+
+
+# write_precompressed relies on zipfile internals checked for these versions only
+PRECOMPRESSED_WRITES = (3, 8) <= sys.version_info[:2] <= (3, 13)
+
+
+def write_precompressed(zip_file, zinfo, compressed):
+    """
+    Append a member whose data is already compressed (zinfo carries its CRC and sizes) to a ZipFile
+    open for writing on a seekable file. zipfile has no public API for this, so these are the steps of
+    ZipFile.writestr on its private state (_lock, _writing, _writecheck, _didModify, fp, start_dir)
+    as they are in CPython 3.8 to 3.13; callers use writestr when PRECOMPRESSED_WRITES is false.
+    """
+    with zip_file._lock:
+        if zip_file._writing:
+            raise ValueError("Can't write to the ZIP file while there is another write handle open on it")
+        zip_file.fp.seek(zip_file.start_dir)
+        zinfo.header_offset = zip_file.fp.tell()
+        zip_file._writecheck(zinfo)
+        zip_file._didModify = True
+        zip_file.fp.write(zinfo.FileHeader())
+        zip_file.fp.write(compressed)
+        zip_file.start_dir = zip_file.fp.tell()
+        zip_file.filelist.append(zinfo)
+        zip_file.NameToInfo[zinfo.filename] = zinfo
+
+
+class ZipBuilder:
+    """
+    Deflate-compressed ZIP with one JSON file per usage point that is appended to while chunks arrive.
+    Members are serialised and compressed on a thread pool (zlib releases the GIL) and written
+    to the archive already compressed, so the archive is ready shortly after the last chunk.
+    """
+
+    def __init__(self, level=6, max_workers=4, fileobj=None):
+        self.level = level
+        self.fileobj = fileobj or SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self.zip_file = zipfile.ZipFile(self.fileobj, "w", zipfile.ZIP_DEFLATED, compresslevel=level)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Bounds the meter readings waiting for compression, so memory does not grow with the job
+        self.pending = threading.BoundedSemaphore(max_workers * 4)
+        self.futures = []
+        # writestr is not safe to call from several threads at once
+        self.write_lock = threading.Lock()
+
+    def add_meter_reading(self, meter_reading):
+        self.pending.acquire()
+        self.futures.append(self.executor.submit(self._compress_and_write, meter_reading))
+
+    def add_payload(self, payload):
+        for meter_reading in payload.get("meterReadings", []):
+            self.add_meter_reading(meter_reading)
+
+    def add_path(self, path):
+        with open_payload(path) as f:
+            for meter_reading in iter_meter_readings(f):
+                self.add_meter_reading(meter_reading)
+
+    def _compress_and_write(self, meter_reading):
+        try:
+            filename = f"{meter_reading['usagePoint']}.json"
+            data = json.dumps(meter_reading, separators=(",", ":")).encode("utf-8")
+            if PRECOMPRESSED_WRITES:
+                self._write_deflated(*deflate_member(filename, data, self.level))
+            else:
+                # writestr compresses under the lock, so the members are no longer compressed in parallel
+                with self.write_lock:
+                    self.zip_file.writestr(self._zinfo(filename), data, zipfile.ZIP_DEFLATED, self.level)
+        finally:
+            self.pending.release()
+
+    @staticmethod
+    def _zinfo(filename):
+        zinfo = zipfile.ZipInfo(filename, date_time=time.localtime(time.time())[:6])
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = 0o600 << 16
+        return zinfo
+
+    def _write_deflated(self, filename, crc, file_size, compressed):
+        zinfo = self._zinfo(filename)
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = len(compressed)
+        write_precompressed(self.zip_file, zinfo, compressed)
+
+    def close(self):
+        """Wait for the pending members, finish the archive and return it as a file object."""
+        for future in self.futures:
+            future.result()
+        self.executor.shutdown()
+        self.zip_file.close()
+        self.fileobj.seek(0)
+        return self.fileobj
+
+
+def get_json(payload_paths):
+    """JSON list of all stored payloads, concatenated without parsing them."""
+    json_buffer = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    writer = io.TextIOWrapper(json_buffer, encoding="utf-8")
+
+    writer.write("[")
+    for i, path in enumerate(payload_paths):
+        if i:
+            writer.write(", ")
+        with open_payload(path) as f:
+            shutil.copyfileobj(f, writer)
+    writer.write("]")
+
+    writer.flush()
+    writer.detach()
+    json_buffer.seek(0)
+
+    return json_buffer
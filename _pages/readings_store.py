@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+from _pages.job_ledger import DATA_DIR
+from _pages.readings_io import open_payload, iter_meter_readings, quality_code
+
+TIMEZONE = ZoneInfo("Europe/Ljubljana")
+
+# Series kept mapped, three file descriptors each
+MAX_MAPS = 32
+
+# One file per column and series, so every column can be mapped and sliced on its own
+COLUMNS = {
+    "timestamps": ("ts", np.dtype("<i8")),
+    "values": ("val", np.dtype("<f4")),
+    "qualities": ("q", np.dtype("u1"))
+}
+
+
+class Readings(NamedTuple):
+    timestamps: np.ndarray
+    values: np.ndarray
+    qualities: np.ndarray
+
+
+def to_epoch(value):
+    """Epoch seconds of an int, date, datetime or ISO string; naive values are local (Europe/Ljubljana) time."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(TIMEZONE)
+    return int(timestamp.timestamp())
+
+
+class ReadingsStore:
+    """
+    Local store of the interval readings per usage point and reading type: int64 epoch seconds,
+    float32 values and uint8 quality codes in flat column files, sorted by time and read through
+    memory maps. An SQLite index maps the usage points to their series and the quality codes to
+    their numbers; a time range is found by binary search in the mapped timestamps.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.directory = os.path.join(data_dir, "store")
+        os.makedirs(self.directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                id INTEGER PRIMARY KEY,
+                usage_point TEXT NOT NULL,
+                reading_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                first_epoch INTEGER,
+                last_epoch INTEGER,
+                UNIQUE (usage_point, reading_type)
+            );
+            CREATE TABLE IF NOT EXISTS qualities (
+                id INTEGER PRIMARY KEY,
+                code TEXT NOT NULL UNIQUE
+            );
+        """)
+        self.conn.commit()
+        self.quality_ids = dict(self.conn.execute("SELECT code, id FROM qualities"))
+        # Maps of the most recently read series by id, dropped when the series changes
+        self.maps = OrderedDict()
+
+    def _path(self, series_id, column):
+        return os.path.join(self.directory, f"{series_id}.{COLUMNS[column][0]}")
+
+    def _quality_id(self, code):
+        if not code:
+            return 0
+        if code not in self.quality_ids:
+            cursor = self.conn.execute("INSERT INTO qualities (code) VALUES (?)", (code,))
+            if cursor.lastrowid > 255:
+                raise ValueError("More than 255 reading quality codes")
+            self.quality_ids[code] = cursor.lastrowid
+        return self.quality_ids[code]
+
+    def add_meter_reading(self, meter_reading):
+        usage_point = meter_reading["usagePoint"]
+        for interval_block in meter_reading.get("intervalBlocks", []):
+            interval_readings = interval_block.get("intervalReadings", [])
+            if not interval_readings:
+                continue
+            epochs = pd.to_datetime([reading["timestamp"] for reading in interval_readings], utc=True,
+                                    format="ISO8601").as_unit("s").asi8
+            values = np.array([reading.get("value") for reading in interval_readings], dtype=np.float64)
+            with self.lock:
+                qualities = np.array([self._quality_id(quality_code(reading)) for reading in interval_readings],
+                                     dtype=np.uint8)
+                self.append(usage_point, interval_block.get("readingType", ""), epochs, values, qualities)
+
+    def add_payload(self, payload):
+        for meter_reading in payload.get("meterReadings", []):
+            self.add_meter_reading(meter_reading)
+
+    def add_path(self, path):
+        with open_payload(path) as f:
+            for meter_reading in iter_meter_readings(f):
+                self.add_meter_reading(meter_reading)
+
+    def append(self, usage_point, reading_type, epochs, values, qualities):
+        """Add readings to a series; readings for timestamps already stored replace the old ones."""
+        epochs = np.asarray(epochs, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float32)
+        qualities = np.asarray(qualities, dtype=np.uint8)
+        if len(epochs) > 1 and np.any(np.diff(epochs) <= 0):
+            order = np.argsort(epochs, kind="stable")
+            epochs, values, qualities = _last_per_timestamp(epochs[order], values[order], qualities[order])
+
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO series (usage_point, reading_type) VALUES (?, ?)",
+                              (usage_point, reading_type))
+            series_id, count, first_epoch, last_epoch = self.conn.execute(
+                "SELECT id, count, first_epoch, last_epoch FROM series WHERE usage_point = ? AND reading_type = ?",
+                (usage_point, reading_type)
+            ).fetchone()
+
+            columns = {"timestamps": epochs, "values": values, "qualities": qualities}
+            if count and epochs[0] <= last_epoch:
+                # Overlaps what is stored: merge and replace the files, maps of the old ones stay valid
+                old = self._read(series_id, count)
+                merged = [np.concatenate([old[i], columns[name]]) for i, name in enumerate(COLUMNS)]
+                order = np.argsort(merged[0], kind="stable")
+                columns = dict(zip(COLUMNS, _last_per_timestamp(*(column[order] for column in merged))))
+                for name, array in columns.items():
+                    path = self._path(series_id, name)
+                    array.tofile(path + ".tmp")
+                    os.replace(path + ".tmp", path)
+                count, first_epoch = 0, None
+            else:
+                for name, array in columns.items():
+                    with open(self._path(series_id, name), "ab") as f:
+                        # Drops what an interrupted append wrote past the indexed count
+                        f.truncate(count * array.itemsize)
+                        f.write(array.tobytes())
+
+            timestamps = columns["timestamps"]
+            self.conn.execute("UPDATE series SET count = ?, first_epoch = ?, last_epoch = ? WHERE id = ?",
+                              (count + len(timestamps), first_epoch if count else int(timestamps[0]),
+                               int(timestamps[-1]), series_id))
+            self.conn.commit()
+            self.maps.pop(series_id, None)
+
+    def _read(self, series_id, count):
+        return [np.fromfile(self._path(series_id, name), dtype=dtype, count=count)
+                for name, (_, dtype) in COLUMNS.items()]
+
+    def _maps(self, series_id, count):
+        maps = self.maps.get(series_id)
+        if maps is None:
+            maps = Readings(*(np.memmap(self._path(series_id, name), dtype=dtype, mode="r", shape=(count,))
+                              for name, (_, dtype) in COLUMNS.items()))
+            self.maps[series_id] = maps
+            # Evicted maps are only dropped, not closed: views handed out by range() may still use them,
+            # and the mapping with its file descriptor goes away with the last of them
+            while len(self.maps) > MAX_MAPS:
+                self.maps.popitem(last=False)
+        self.maps.move_to_end(series_id)
+        return maps
+
+    def series(self, usage_point=None):
+        """(usage_point, reading_type, count, first_epoch, last_epoch) of the stored series."""
+        query = "SELECT usage_point, reading_type, count, first_epoch, last_epoch FROM series"
+        with self.lock:
+            if usage_point is None:
+                return self.conn.execute(query + " ORDER BY usage_point, reading_type").fetchall()
+            return self.conn.execute(query + " WHERE usage_point = ? ORDER BY reading_type", (usage_point,)).fetchall()
+
+    def range(self, usage_point, start=None, end=None, reading_type=None):
+        """
+        Readings of a usage point in [start, end) as NumPy views into the memory-mapped files, without copying.
+        reading_type defaults to the first one stored for the usage point.
+        """
+        with self.lock:
+            query = "SELECT id, count FROM series WHERE usage_point = ?"
+            parameters = [usage_point]
+            if reading_type is not None:
+                query += " AND reading_type = ?"
+                parameters.append(reading_type)
+            row = self.conn.execute(query + " ORDER BY reading_type LIMIT 1", parameters).fetchone()
+            if row is None or not row[1]:
+                return Readings(np.empty(0, np.int64), np.empty(0, np.float32), np.empty(0, np.uint8))
+            maps = self._maps(*row)
+
+        timestamps = maps.timestamps
+        first = 0 if start is None else int(np.searchsorted(timestamps, to_epoch(start), side="left"))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, to_epoch(end), side="left"))
+        return Readings(*(column[first:last] for column in maps))
+
+    def quality_codes(self):
+        """Quality code strings by their number in the store; 0 means no quality flag."""
+        with self.lock:
+            return {0: "", **{number: code for code, number in self.quality_ids.items()}}
+
+
+def _last_per_timestamp(epochs, values, qualities):
+    # epochs are sorted; of equal timestamps keep the one added last
+    keep = np.append(epochs[1:] != epochs[:-1], True)
+    return epochs[keep], values[keep], qualities[keep]
@@ -0,0 +1,133 @@
+import json
+import time
+import zlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+from _pages import telemetry
+
+
+class ResponseCache:
+    """
+    Process-wide cache of meter readings, one entry per usage point and requested window.
+    Entries are kept as compressed JSON, so max_bytes bounds the memory they take; the least
+    recently used ones are evicted above it and all of them after max_age seconds. Every lookup
+    passes the age it accepts, so sessions with different settings can share the cache.
+    It also tracks the usage points being requested right now, so concurrent sessions asking for
+    the same usage point and window wait for one request instead of sending their own.
+    """
+
+    def __init__(self, max_age=48 * 3600, max_bytes=256 * 1024 * 1024):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.coalesced = 0
+
+    @staticmethod
+    def key(identity, usage_point, message_type, start_date, end_date):
+        # Daily and monthly pulls have no explicit range, the window they return moves with the day
+        if message_type != 'Specify date':
+            start_date, end_date = date.today(), ""
+        return identity, usage_point, message_type, str(start_date), str(end_date)
+
+    def get(self, key, ttl=None):
+        """The meter reading cached for key if it is at most ttl seconds old (max_age by default)."""
+        ttl = self.max_age if ttl is None else min(ttl, self.max_age)
+        with self.lock:
+            entry = self.entries.get(key)
+            age = time.monotonic() - entry[0] if entry is not None else None
+            if entry is not None and age > self.max_age:
+                self._remove(key)
+                entry = None
+            if entry is None or age > ttl:
+                return None
+            self.entries.move_to_end(key)
+        # Every caller gets its own copy, so nobody changes the cached one
+        return json.loads(zlib.decompress(entry[1]))
+
+    def put(self, key, meter_reading):
+        data = zlib.compress(json.dumps(meter_reading, separators=(",", ":")).encode(), 1)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic(), data)
+            self.size += len(data)
+            while self.size > self.max_bytes and self.entries:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        self.size -= len(self.entries.pop(key)[1])
+
+    def claim(self, keys):
+        """
+        Split keys into the ones the caller has to request, as {key: future} that must be passed
+        to release(), and the ones already requested by someone else, as {key: future} to wait for.
+        """
+        claimed, waiting = {}, {}
+        with self.lock:
+            for key in keys:
+                future = self.in_flight.get(key)
+                if future is None:
+                    claimed[key] = self.in_flight[key] = Future()
+                else:
+                    waiting[key] = future
+            self.coalesced += len(waiting)
+        return claimed, waiting
+
+    def release(self, claimed, meter_readings=None, error=None):
+        """Hand the meter readings (by key) or the error of a request to everyone waiting for it."""
+        with self.lock:
+            for key in claimed:
+                del self.in_flight[key]
+        for key, future in claimed.items():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result((meter_readings or {}).get(key))
+
+
+def cached_fetch(cache, identity, message_type, start_date, end_date, usage_points_chunk, fetch, ttl=None):
+    """
+    Serve the usage points of a chunk from the cache when they are at most ttl seconds old, wait
+    for the ones another session is requesting already and fetch(missing_points) only the rest.
+    Returns a payload shaped like an API response.
+    """
+    meter_readings = []
+    missing = {}
+    for usage_point in usage_points_chunk:
+        key = cache.key(identity, usage_point, message_type, start_date, end_date)
+        meter_reading = cache.get(key, ttl)
+        if meter_reading is None:
+            missing[key] = usage_point
+        else:
+            meter_readings.append(meter_reading)
+
+    telemetry.add(cache_hits=len(meter_readings), cache_misses=len(missing))
+    if not missing:
+        return {"meterReadings": meter_readings}
+
+    claimed, waiting = cache.claim(missing)
+    telemetry.add(coalesced=len(waiting))
+    payload = {"meterReadings": []}
+    fetched = {}
+    try:
+        if claimed:
+            payload = fetch([missing[key] for key in claimed])
+        for meter_reading in payload.get("meterReadings", []):
+            key = cache.key(identity, meter_reading["usagePoint"], message_type, start_date, end_date)
+            cache.put(key, meter_reading)
+            fetched[key] = meter_reading
+    except BaseException as e:
+        cache.release(claimed, error=e)
+        raise
+    cache.release(claimed, fetched)
+
+    # Our own request is done before waiting for the others, so two sessions never wait for each other
+    shared = [future.result() for future in waiting.values()]
+    payload["meterReadings"] = meter_readings + payload.get("meterReadings", []) + \
+        [meter_reading for meter_reading in shared if meter_reading is not None]
+    return payload
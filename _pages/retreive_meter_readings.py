@@ -1,10 +1,30 @@
-import json
-import math
-import zipfile
-import pandas as pd
+import os
+from datetime import date, timedelta
+from dataclasses import replace
+from functools import partial
 import streamlit as st
-import requests
+import pandas as pd
 from io import BytesIO
+from _pages.informatika_client import InformatikaClient, SECRETS
+from _pages.rate_limiter import get_rate_limiter
+from _pages.circuit_breaker import get_circuit_breaker
+from _pages.response_cache import ResponseCache
+from _pages.readings_io import get_json, ZipBuilder
+from _pages.background_jobs import get_job_manager
+from _pages.distribution import DistributionBuilder
+from _pages.columnar import ColumnarBuilder
+from _pages.job_ledger import JobLedger
+from _pages.watermarks import Watermarks
+from _pages.readings_store import ReadingsStore
+from _pages.retrieval import MAX_WORKERS, WINDOW_WORKERS
+from _pages.telemetry import to_csv, to_prometheus
+from _pages.retrieval_job import MESSAGE_TYPES, RetrievalSettings, Retriever, read_tagged_usage_points, retrieval_task
+
+# Streamlit serves a download from memory, so each one needs about its file size in RAM on the server
+# Highest 'Concurrent requests' a session can choose
+MAX_CONCURRENT_REQUESTS = 16
+
+DOWNLOAD_HELP = 'The file is built on disk and read into memory whole when the download starts.'
 
 
 def convert(response_json):
@@ -13,56 +33,175 @@ def convert(response_json):
     return json_file
 
 
-def request(message_type, ceeps_id, usage_points_chunk, start_date, end_date):
-    base_url = "https://api.informatika.si/enotna-vstopna-tocka/merilni-podatki/meter-readings"
+@st.cache_resource
+def get_client(ceeps_id):
+    # Shared by all chunks and reruns, so connections to the API are reused
+    return InformatikaClient(st.secrets[SECRETS[ceeps_id]], ceeps_id,
+                             pool_size=MAX_CONCURRENT_REQUESTS * WINDOW_WORKERS, rate_limiter=get_rate_limiter(ceeps_id),
+                             circuit_breaker=get_circuit_breaker(ceeps_id))
+
+
+@st.cache_resource
+def get_ledger():
+    ledger = JobLedger()
+    ledger.purge()
+    return ledger
+
+
+@st.cache_resource
+def get_watermarks():
+    return Watermarks()
+
+
+@st.cache_resource
+def get_cache():
+    return ResponseCache()
+
+
+@st.cache_resource
+def get_store():
+    return ReadingsStore()
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
 
-    encoded_string = st.secrets['encoded_string_nme']
-    if ceeps_id == "SFA":
-        encoded_string = st.secrets['encoded_string_sfa']
 
-    headers = {
-        'accept': 'application/json',
-        'Authorization': f'Basic {encoded_string}'
-    }
+def read_json(payload_paths):
+    with get_json(payload_paths) as f:
+        return f.read()
 
-    if message_type == 'Daily 15 minute':
-        base_url += '?messageType=D1_15MIN'
-    elif message_type == 'Monthly 15 minute':
-        base_url += '?messageType=M1_15MIN'
-    elif message_type == 'Specify date':
-        base_url += f'?startTime={start_date}&endTime={end_date}'
 
-    usage_points_str = '&'.join(f"usagePoints={point}" for point in usage_points_chunk)
-    complete_url = f"{base_url}&{usage_points_str}"
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes} min {seconds} s" if minutes else f"{seconds} s"
 
-    return requests.get(complete_url, headers=headers)
 
+def show_job_result(job):
+    runs = job.result["runs"]
+    for run in runs:
+        for result in run.failed:
+            st.warning(f"Skipped {', '.join(result.usage_points)} due to error: {result.error}")
 
-def get_zip(json_responses):
-    zip_buffer = BytesIO()
+        st.caption(f"Retrieved {len(run.remaining)} usage points in {len(run.results)} chunks in {run.elapsed:.1f} s."
+                   + (f" {run.resumed} usage points were resumed from an earlier run." if run.resumed else ""))
+        if run.cache_hits + run.cache_misses:
+            st.caption(f"Cache: {run.cache_hits} hits, {run.cache_misses} misses "
+                       f"({run.cache_hits / (run.cache_hits + run.cache_misses):.0%} hit ratio).")
 
-    with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-        for response_json in json_responses:
-            meter_readings = response_json.get("meterReadings", [])
-            for meter_reading in meter_readings:
-                usage_point = meter_reading["usagePoint"]
-                filename = f"{usage_point}.json"
-                json_data = json.dumps(meter_reading, separators=(",", ":"))
-                zip_file.writestr(filename, json_data)
+    rows = job.result.get("telemetry")
+    if rows:
+        with st.expander("Timing"):
+            df = pd.DataFrame(rows)
+            summary = df.groupby("distribution").agg(chunks=("chunk", "count"), usage_points=("usage_points", "sum"),
+                                                     meter_readings=("meter_readings", "sum"),
+                                                     latency=("latency", "median"), ttfb=("ttfb", "median"),
+                                                     retries=("retries", "sum"), cache_hits=("cache_hits", "sum"),
+                                                     coalesced=("coalesced", "sum"))
+            st.dataframe(summary)
+            col_left, col_right = st.columns(2)
+            with col_left:
+                st.download_button("Download timing CSV", data=to_csv(rows), file_name='retrieval_timing.csv',
+                                   mime='text/csv', key=f"timing_csv_{job.id}")
+            with col_right:
+                st.download_button("Download Prometheus metrics", data=to_prometheus(rows),
+                                   file_name='retrieval_metrics.prom', mime='text/plain', key=f"timing_prom_{job.id}")
 
-    zip_buffer.seek(0)
+    if job.result["payload_paths"]:
+        st.download_button(
+            "Download",
+            type='primary',
+            data=partial(read_json, job.result["payload_paths"]),
+            file_name='meter_readings.json',
+            mime='application/json',
+            help=DOWNLOAD_HELP + ' The JSON is uncompressed, for big jobs prefer the ZIP.',
+            key=f"json_{job.id}"
+        )
+        st.download_button(
+            "Download ZIP",
+            type='primary',
+            data=partial(read_file, job.result["zip_path"]),
+            file_name='meter_readings.zip',
+            help=DOWNLOAD_HELP,
+            key=f"zip_{job.id}"
+        )
 
-    return zip_buffer
+    if job.result.get("columnar_path"):
+        st.download_button(
+            "Download table",
+            type='primary',
+            data=partial(read_file, job.result["columnar_path"]),
+            file_name='meter_readings' + os.path.splitext(job.result["columnar_path"])[1],
+            help=DOWNLOAD_HELP,
+            key=f"columnar_{job.id}"
+        )
+
+    if job.result.get("distributions_path"):
+        st.download_button(
+            "Download distributions",
+            type='primary',
+            data=partial(read_file, job.result["distributions_path"]),
+            file_name='files.zip',
+            mime='application/zip',
+            help=DOWNLOAD_HELP,
+            key=f"distributions_{job.id}"
+        )
+        if job.result["missing_data"]:
+            st.write("Usage points with missing data")
+            st.dataframe(job.result["missing_data"])
+
+
+def show_api_health():
+    for identity in SECRETS:
+        status = get_circuit_breaker(identity).status
+        text = (f"API {identity}: {status['state'].replace('_', '-')}, {status['error_rate']:.0%} errors and "
+                f"{status['slow_rate']:.0%} slow responses recently, median {status['median_latency']} s")
+        if status["state"] == "open":
+            st.warning(f"{text}. Requests fail fast, queued chunks are retried in {status['retry_in']:.0f} s.")
+        elif status["state"] == "half_open":
+            st.info(f"{text}. Probing whether the API is back.")
+        elif status["trips"]:
+            st.caption(text)
+
+
+def show_jobs():
+    show_api_health()
+    manager = get_job_manager()
+    own_jobs = st.session_state.setdefault('retrieval_jobs', [])
+    jobs = [job for job in manager.list() if job.name.startswith("Meter readings")]
+
+    for job in jobs:
+        own = " (this session)" if job.id in own_jobs else ""
+        with st.container(border=True):
+            st.write(f"**{job.name}**{own} - {job.status}")
+            if job.active:
+                eta = f", about {format_seconds(job.eta)} left" if job.eta is not None else ""
+                st.progress(job.progress, text=f"{job.message} - {format_seconds(job.elapsed)} elapsed{eta}")
+            elif job.status == "failed":
+                st.error(job.error)
+            elif job.id in own_jobs:
+                show_job_result(job)
+            elif st.button("Show result", key=f"show_{job.id}"):
+                own_jobs.append(job.id)
+                st.rerun()
+
+    # Polling stops with a full rerun once nothing is running anymore
+    if st.session_state.get('jobs_active') and not manager.has_active():
+        st.session_state['jobs_active'] = False
+        st.rerun()
 
 
 def main():
     st.set_page_config(layout="centered")
 
-    st.subheader("Meter readings DEV MODE")
+    st.subheader("Meter readings")
 
-    ceeps_id = st.selectbox('CEEPS Identity', ('NME', 'SFA'))
+    ceeps_id = st.selectbox('CEEPS Identity', ('NME', 'SFA'),
+                            help="Usage points tagged in a 'CEEPS' column of the upload are retrieved with their "
+                                 "own identity, in parallel")
 
-    message_type = st.selectbox('Type of meter readings', ('Daily 15 minute', 'Monthly 15 minute', 'Specify date'))
+    message_type = st.selectbox('Type of meter readings', MESSAGE_TYPES)
 
     start_date, end_date = "", ""
     if message_type == 'Specify date':
@@ -71,41 +210,77 @@ def main():
             start_date = st.date_input('Start date')
         with col_right:
             end_date = st.date_input('End date')
+    elif message_type == 'Since last retrieval':
+        start_date = st.date_input('Start date for usage points without earlier data',
+                                   value=date.today() - timedelta(days=1))
+
+    with st.expander("Advanced"):
+        max_workers = st.number_input('Concurrent requests', min_value=1, max_value=MAX_CONCURRENT_REQUESTS,
+                                      value=MAX_WORKERS[ceeps_id],
+                                      help='1 fetches the chunks one after another')
+        chunk_size = st.number_input('Maximum chunk size', min_value=1, max_value=200, value=50,
+                                     help='Chunks start at this size, are halved when the API times out or fails '
+                                          'and grow back after consecutive fast responses')
+        timeout = st.number_input('Timeout per request (s)', min_value=10, max_value=600, value=120)
+        cache_ttl = st.number_input('Cache responses for (hours)', min_value=0.0, max_value=48.0, value=6.0,
+                                    help='Usage points retrieved for the same window within this time are not '
+                                         'requested again. 0 disables the cache.')
+        window_months = st.number_input('Split date ranges into windows of (months)', min_value=0, max_value=12,
+                                        value=1, help='Long date ranges are requested per window in parallel. '
+                                                      '0 requests the whole range at once.')
+        stream = st.checkbox('Low memory mode', help='Stream responses to disk and build the downloads there one '
+                                                      'meter reading at a time. Skips the cache and date windows. '
+                                                      'A download is still loaded into memory whole when clicked.')
+        zip_level = st.slider('ZIP compression level', min_value=0, max_value=9, value=6,
+                              help='Higher levels make a smaller download but take more CPU time')
+        columnar_format = st.selectbox('Columnar output', ('None', 'parquet', 'arrow'),
+                                       help='Also write a long table of usage point, reading type, timestamp, value '
+                                            'and quality as Parquet or Arrow IPC')
+        partition_by_month = st.checkbox('One columnar file per month', disabled=columnar_format == 'None')
+        save_to_store = st.checkbox('Save to the local readings store', value=True,
+                                    help='Append the readings to the memory-mapped store used by the analyses, '
+                                         'so they do not have to parse the JSON files again')
+        restart = st.checkbox('Start over', help='Ignore usage points already retrieved by an earlier run of the same job')
 
     uploaded_file = st.file_uploader('Upload a file', type='xlsx')
 
-    if uploaded_file is not None:
-        df = pd.read_excel(uploaded_file, converters={'Merilna točka': str})
+    mt_dist_file = st.file_uploader('Upload mt_dist file to also merge to distributions (optional)', type='xlsx',
+                                    help='The distribution workbooks are built from the retrieved meter readings '
+                                         'directly, without downloading and uploading the JSON files')
 
-        usage_points_list = df['Merilna točka'].tolist()
+    if uploaded_file is not None:
+        usage_points = read_tagged_usage_points(uploaded_file, ceeps_id)
+        for identity in [identity for identity in usage_points if identity not in SECRETS]:
+            st.error(f"Unknown CEEPS identity {identity}, skipping its {len(usage_points.pop(identity))} usage points.")
+        if len(usage_points) > 1:
+            st.caption("Retrieving in parallel: " + ", ".join(f"{identity} {len(points)} usage points"
+                                                             for identity, points in usage_points.items()))
 
         if st.button('Retrieve', type='primary'):
-            chunk_size = 50
-            num_chunks = math.ceil(len(usage_points_list) / chunk_size)
-            json_responses = []
-
-            for i in range(num_chunks):
-                usage_points_chunk = usage_points_list[i * chunk_size:(i + 1) * chunk_size]
-                response = request(message_type, ceeps_id, usage_points_chunk, start_date, end_date)
-                if response.status_code != 200:
-                    st.write(f"Error in chunk {i + 1}: {response.json()}")
-                else:
-                    json_responses.append(response.json())
-
-            if json_responses:
-                st.download_button(
-                    "Download",
-                    type='primary',
-                    data=json.dumps(json_responses),
-                    file_name='meter_readings.json',
-                    mime='application/json'
-                )
-                st.download_button(
-                    "Download ZIP",
-                    type='primary',
-                    data=get_zip(json_responses),
-                    file_name='meter_readings.zip'
-                )
-
-
-main()
\ No newline at end of file
+            settings = RetrievalSettings(max_workers, chunk_size, timeout, cache_ttl, restart, window_months, stream)
+            distribution = DistributionBuilder(BytesIO(mt_dist_file.getvalue())) if mt_dist_file is not None else None
+            columnar = ColumnarBuilder(columnar_format, partition_by_month) if columnar_format != 'None' else None
+            zip_builder = ZipBuilder(zip_level)
+            # One retriever per identity with its own concurrency, all writing to the same outputs
+            retrievers = {}
+            for identity in usage_points:
+                identity_settings = settings if identity == ceeps_id else replace(settings,
+                                                                                 max_workers=MAX_WORKERS[identity])
+                retrievers[identity] = Retriever(get_client(identity), get_ledger(), get_watermarks(), get_cache(),
+                                                 identity_settings, zip_builder, distribution, columnar,
+                                                 get_store() if save_to_store else None)
+
+            # Runs in the background, so widget interactions and reruns do not interrupt it
+            count = sum(len(points) for points in usage_points.values())
+            job = get_job_manager().submit(
+                f"Meter readings {' + '.join(usage_points)} {message_type} ({count} usage points)",
+                retrieval_task, retrievers, message_type, usage_points, start_date, end_date
+            )
+            st.session_state.setdefault('retrieval_jobs', []).append(job.id)
+
+    active = get_job_manager().has_active()
+    st.session_state['jobs_active'] = active
+    st.fragment(show_jobs, run_every=2 if active else None)()
+
+
+main()
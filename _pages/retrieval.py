@@ -0,0 +1,247 @@
+import time
+from collections import deque
+from datetime import date, datetime
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, List, Optional
+from _pages import telemetry
+from _pages.circuit_breaker import CircuitOpenError
+
+# Default number of chunks fetched at the same time for each CEEPS identity
+MAX_WORKERS = {
+    "NME": 4,
+    "SFA": 4
+}
+
+# Date windows of one chunk fetched at the same time
+WINDOW_WORKERS = 4
+
+
+class RetryableError(Exception):
+    """Raised by a fetch function for failures worth retrying with a smaller chunk (timeouts, 5xx)."""
+
+
+class ThrottledError(Exception):
+    """
+    Raised by a fetch function when the API still answers 429 after the rate limiter backed off.
+    The chunk fails as it is: splitting it would only send more requests.
+    """
+
+
+@dataclass
+class ChunkResult:
+    index: int
+    usage_points: List[str]
+    payload: Optional[Any] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    offset: int = 0
+    retryable: bool = False
+    deferred: bool = False
+    started: float = 0.0
+    attempts: int = 1
+    metrics: Optional[telemetry.ChunkMetrics] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def fetch_chunk(fetch, index, usage_points_chunk, offset=0, attempts=1):
+    start = time.perf_counter()
+    result = ChunkResult(index=index, usage_points=usage_points_chunk, offset=offset, started=time.time(),
+                         attempts=attempts)
+    result.metrics = telemetry.ChunkMetrics(usage_points=len(usage_points_chunk), retries=attempts - 1)
+    with telemetry.collecting(result.metrics):
+        try:
+            result.payload = fetch(usage_points_chunk)
+        except CircuitOpenError as e:
+            result.error = str(e)
+            result.deferred = True
+        except RetryableError as e:
+            result.error = str(e)
+            result.retryable = True
+        except Exception as e:
+            result.error = str(e)
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+class ChunkSizer:
+    """
+    Chunk size that halves when a chunk fails and doubles again after
+    grow_after consecutive successes that took less than fast_seconds.
+    """
+
+    def __init__(self, chunk_size=50, min_size=1, max_size=50, grow_after=3, fast_seconds=30.0):
+        self.size = chunk_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.grow_after = grow_after
+        self.fast_seconds = fast_seconds
+        self.fast_successes = 0
+
+    def success(self, elapsed):
+        if elapsed >= self.fast_seconds:
+            self.fast_successes = 0
+            return
+        self.fast_successes += 1
+        if self.fast_successes >= self.grow_after:
+            self.size = min(self.max_size, self.size * 2)
+            self.fast_successes = 0
+
+    def failure(self, failed_size):
+        self.size = max(self.min_size, min(self.size, failed_size) // 2)
+        self.fast_successes = 0
+
+
+def fetch_adaptive(fetch, usage_points, max_workers=1, sizer=None, on_result=None, wait_ready=None,
+                   defer_timeout=1800.0):
+    """
+    Fetch all usage points in chunks whose size adapts to how the API behaves.
+    A chunk that fails with RetryableError is split in half and both halves are fetched again,
+    until the single failing usage point is isolated. Other errors are reported without retrying.
+    Chunks refused with CircuitOpenError are put aside, without being split; once nothing else is
+    left, wait_ready(timeout) is called and they are fetched again if it returns True. Chunks still
+    put aside defer_timeout seconds after the first refusal are reported as failed.
+    Returns the ChunkResults of the final chunks, ordered by their position in usage_points.
+    on_result(result, done, total) is called in the calling thread after every finished chunk.
+    """
+    sizer = sizer or ChunkSizer()
+    retry = deque()
+    deferred = []
+    defer_deadline = None
+    next_offset = 0
+    done_points = 0
+    results = []
+
+    def next_chunk():
+        nonlocal next_offset
+        if retry:
+            return retry.popleft()
+        if next_offset >= len(usage_points):
+            return None
+        offset = next_offset
+        next_offset += sizer.size
+        return offset, usage_points[offset:next_offset], 1
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        in_flight = set()
+        while True:
+            while len(in_flight) < max_workers:
+                chunk = next_chunk()
+                if chunk is None:
+                    break
+                offset, usage_points_chunk, attempts = chunk
+                in_flight.add(executor.submit(fetch_chunk, fetch, 0, usage_points_chunk, offset, attempts))
+
+            if not in_flight and deferred:
+                left = defer_deadline - time.monotonic()
+                if left > 0 and wait_ready(left):
+                    retry.extend(deferred)
+                    deferred.clear()
+                    continue
+
+            if not in_flight:
+                break
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                if result.deferred and wait_ready is not None:
+                    if defer_deadline is None:
+                        defer_deadline = time.monotonic() + defer_timeout
+                    deferred.append((result.offset, result.usage_points, result.attempts))
+                    continue
+                if result.ok:
+                    sizer.success(result.elapsed)
+                elif result.retryable and len(result.usage_points) > 1:
+                    sizer.failure(len(result.usage_points))
+                    half = len(result.usage_points) // 2
+                    attempts = result.attempts + 1
+                    retry.appendleft((result.offset + half, result.usage_points[half:], attempts))
+                    retry.appendleft((result.offset, result.usage_points[:half], attempts))
+                    continue
+
+                results.append(result)
+                done_points += len(result.usage_points)
+                if on_result is not None:
+                    on_result(result, done_points, len(usage_points))
+
+    for offset, usage_points_chunk, attempts in deferred:
+        results.append(ChunkResult(index=0, usage_points=usage_points_chunk, offset=offset, attempts=attempts,
+                                   started=time.time(), error="API unavailable (circuit breaker open)"))
+        done_points += len(usage_points_chunk)
+        if on_result is not None:
+            on_result(results[-1], done_points, len(usage_points))
+
+    results.sort(key=lambda r: r.offset)
+    for i, result in enumerate(results):
+        result.index = i
+    return results
+
+
+def split_date_range(start_date, end_date, months=1):
+    """
+    Split [start_date, end_date] into windows that end on the first day of a calendar month,
+    each covering at most the given number of months. Neighbouring windows share their
+    boundary day, the overlap is removed again by merge_meter_readings.
+    """
+    windows = []
+    start = start_date
+    while True:
+        month = start.month - 1 + months
+        next_start = date(start.year + month // 12, month % 12 + 1, 1)
+        if next_start >= end_date:
+            windows.append((start, end_date))
+            return windows
+        windows.append((start, next_start))
+        start = next_start
+
+
+def merge_meter_readings(payloads):
+    """
+    Stitch several responses into one with a single meterReading per usage point.
+    Interval readings of the same reading type are deduplicated by timestamp and sorted,
+    the other fields of an interval block are taken from its first response.
+    """
+    meter_readings = {}
+    blocks = {}
+    for payload in payloads:
+        for meter_reading in payload.get("meterReadings", []):
+            usage_point = meter_reading["usagePoint"]
+            if usage_point not in meter_readings:
+                meter_readings[usage_point] = meter_reading
+                blocks[usage_point] = {}
+            for interval_block in meter_reading.get("intervalBlocks", []):
+                # The first block of a reading type keeps its other fields, only its readings are merged
+                block, readings = blocks[usage_point].setdefault(interval_block["readingType"], (interval_block, {}))
+                for reading in interval_block.get("intervalReadings", []):
+                    readings.setdefault(reading["timestamp"], reading)
+
+    for usage_point, meter_reading in meter_readings.items():
+        meter_reading["intervalBlocks"] = [
+            dict(block, intervalReadings=sorted(readings.values(),
+                                                key=lambda r: datetime.fromisoformat(r["timestamp"])))
+            for block, readings in blocks[usage_point].values()
+        ]
+
+    return {"meterReadings": list(meter_readings.values())}
+
+
+def fetch_sharded(fetch_window, usage_points_chunk, windows, max_workers=WINDOW_WORKERS):
+    """
+    Fetch a chunk once per date window, in parallel, and merge the responses.
+    fetch_window(usage_points_chunk, window_start, window_end) returns one response payload.
+    The first failing window fails the whole chunk with its original exception.
+    """
+    metrics = telemetry.current()
+
+    def fetch_one(window):
+        # The window requests report into the metrics of the chunk they belong to
+        with telemetry.collecting(metrics):
+            return fetch_window(usage_points_chunk, *window)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as executor:
+        payloads = list(executor.map(fetch_one, windows))
+    return merge_meter_readings(payloads)
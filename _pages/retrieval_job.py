@@ -0,0 +1,342 @@
+import io
+import os
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+import requests
+import pandas as pd
+from _pages import telemetry
+from _pages.job_ledger import DATA_DIR, job_id
+from _pages.columnar import FORMATS
+from _pages.response_cache import cached_fetch
+from _pages.readings_io import spool_response, iter_meter_readings
+from _pages.retrieval import RetryableError, ThrottledError, ChunkSizer, fetch_adaptive, split_date_range, \
+    fetch_sharded, WINDOW_WORKERS
+
+MESSAGE_TYPES = ('Daily 15 minute', 'Monthly 15 minute', 'Specify date', 'Since last retrieval')
+
+
+@dataclass
+class RetrievalSettings:
+    max_workers: int = 4
+    chunk_size: int = 50
+    timeout: int = 120
+    cache_ttl: float = 6.0
+    restart: bool = False
+    window_months: int = 1
+    stream: bool = False
+    breaker_wait: int = 1800
+
+
+@dataclass
+class RetrievalRun:
+    job: str
+    usage_points: List[str]
+    remaining: List[str]
+    identity: str = ""
+    start_date: Any = ""
+    end_date: Any = ""
+    windows: Optional[list] = None
+    sizer: Optional[ChunkSizer] = None
+    results: list = field(default_factory=list)
+    payload_paths: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+    @property
+    def resumed(self):
+        return len(self.usage_points) - len(self.remaining)
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+
+def read_tagged_usage_points(file, default_identity):
+    """
+    Usage points per CEEPS identity. An optional 'CEEPS' column tags each usage point with
+    the identity it is retrieved with, untagged ones use default_identity.
+    """
+    df = pd.read_excel(file, converters={'Merilna točka': str, 'CEEPS': str})
+    if 'CEEPS' not in df.columns:
+        return {default_identity: df['Merilna točka'].tolist()}
+
+    identities = df['CEEPS'].fillna(default_identity).str.strip().str.upper().replace("", default_identity)
+    return {identity: df.loc[identities == identity, 'Merilna točka'].tolist() for identity in identities.unique()}
+
+
+def request(message_type, client, usage_points_chunk, start_date, end_date, timeout=120, stream=False):
+    # Errors are raised instead of reported here, because the chunks run in worker threads.
+    # Timeouts and 5xx make the chunk get split and retried, a 429 the rate limiter could not wait out fails it.
+    # With stream the body is spooled to a temp file instead of being parsed.
+    try:
+        response = client.get_meter_readings(message_type, usage_points_chunk, start_date, end_date,
+                                             timeout=timeout, stream=stream)
+        # elapsed is measured until the response headers arrived
+        telemetry.add(requests=1, url_bytes=len(response.url), ttfb=response.elapsed.total_seconds())
+        telemetry.record(status=response.status_code)
+        if response.status_code == 200:
+            if stream:
+                spool = spool_response(response)
+                telemetry.add(response_bytes=spool.seek(0, io.SEEK_END))
+                spool.seek(0)
+                return spool
+            telemetry.add(response_bytes=len(response.content))
+            return response.json()
+    except requests.exceptions.Timeout:
+        raise RetryableError("Timeout: Server took too long to respond.")
+    except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+        raise RetryableError(f"Request failed: {e}")
+
+    if response.status_code == 429:
+        raise ThrottledError("Throttled: the API kept answering 429 Too Many Requests")
+    if response.status_code >= 500:
+        raise RetryableError(f"Server error {response.status_code}: {response.text[:200]}")
+    raise RuntimeError(response.json())
+
+
+def cached_request(cache, message_type, client, usage_points_chunk, start_date, end_date, timeout=120, windows=None,
+                   ttl=None, window_workers=WINDOW_WORKERS):
+    def fetch(missing):
+        if not windows or len(windows) < 2:
+            return request(message_type, client, missing, start_date, end_date, timeout)
+        return fetch_sharded(
+            lambda points, window_start, window_end: request(message_type, client, points, window_start, window_end,
+                                                             timeout),
+            missing,
+            windows,
+            window_workers
+        )
+
+    return cached_fetch(cache, client.identity, message_type, start_date, end_date, usage_points_chunk, fetch, ttl)
+
+
+def record_spooled(ledger, watermarks, job, ceeps_id, usage_points, spool, metrics=None):
+    # Read the spooled body twice, once meter reading by meter reading for the watermarks
+    # and once as raw bytes into the ledger, without ever holding the parsed response
+    def counted(meter_readings):
+        for meter_reading in meter_readings:
+            if metrics is not None:
+                metrics.add(meter_readings=1)
+            yield meter_reading
+
+    with spool:
+        text = io.TextIOWrapper(spool, encoding="utf-8")
+        watermarks.update_meter_readings(ceeps_id, counted(iter_meter_readings(text)))
+        text.detach()
+        spool.seek(0)
+        return ledger.record_stream(job, usage_points, spool)
+
+
+class Retriever:
+    """
+    Runs meter-reading retrievals for one CEEPS identity, independent of the UI.
+    Every finished chunk is checkpointed in the ledger, moves the watermarks and, when a
+    ZipBuilder, DistributionBuilder, ColumnarBuilder or ReadingsStore is given, is added to it while
+    the other chunks are still running.
+    """
+
+    def __init__(self, client, ledger, watermarks, cache, settings=None, zip_builder=None, distribution=None,
+                 columnar=None, store=None):
+        self.client = client
+        self.ledger = ledger
+        self.watermarks = watermarks
+        self.cache = cache
+        self.settings = settings or RetrievalSettings()
+        self.zip_builder = zip_builder
+        self.distribution = distribution
+        self.columnar = columnar
+        self.store = store
+
+    @property
+    def builders(self):
+        return [builder for builder in (self.zip_builder, self.distribution, self.columnar, self.store) if builder is not None]
+
+    def run(self, message_type, usage_points, start_date="", end_date="", on_start=None, on_result=None):
+        """
+        Retrieve one job. on_start(run) is called once the job is planned,
+        on_result(run, result, done, total) after every finished chunk.
+        """
+        settings = self.settings
+        ceeps_id = self.client.identity
+        ledger = self.ledger
+
+        job = job_id(ceeps_id, message_type, start_date, end_date, usage_points)
+        if settings.restart:
+            ledger.reset(job)
+
+        run = RetrievalRun(job=job, usage_points=usage_points, remaining=ledger.missing_points(job, usage_points),
+                           identity=ceeps_id, start_date=start_date, end_date=end_date)
+        if run.resumed:
+            for path in ledger.payload_paths(job):
+                for builder in self.builders:
+                    builder.add_path(path)
+
+        # Long ranges are requested per window, in parallel, and stitched back together per usage point
+        if message_type == 'Specify date' and settings.window_months and not settings.stream:
+            run.windows = split_date_range(start_date, end_date, settings.window_months)
+        # Chunks times windows in flight stay within the connection pool of the client
+        window_workers = max(1, min(WINDOW_WORKERS, self.client.pool_size // settings.max_workers))
+
+        run.sizer = ChunkSizer(chunk_size=settings.chunk_size, max_size=settings.chunk_size,
+                               fast_seconds=settings.timeout / 4)
+
+        if on_start is not None:
+            on_start(run)
+
+        def record(result, done, total):
+            # Checkpoint every chunk as soon as it is done, so a rerun can continue from here
+            path = None
+            if result.ok and settings.stream:
+                path = record_spooled(ledger, self.watermarks, job, ceeps_id, result.usage_points, result.payload,
+                                      result.metrics)
+            elif result.ok:
+                result.metrics.set(meter_readings=len(result.payload.get("meterReadings", [])))
+                ledger.record(job, result.usage_points, result.payload)
+                self.watermarks.update(ceeps_id, result.payload)
+            else:
+                ledger.record_error(job, result.usage_points, result.error)
+
+            for builder in self.builders if result.ok else []:
+                if path is not None:
+                    builder.add_path(path)
+                else:
+                    builder.add_payload(result.payload)
+            # Checkpointed: the results kept with the job only need the outcome, not the parsed response
+            result.payload = None
+
+            if on_result is not None:
+                on_result(run, result, done, total)
+
+        def fetch(chunk):
+            if settings.stream:
+                return request(message_type, self.client, chunk, start_date, end_date, settings.timeout, stream=True)
+            # The cache is shared by all sessions, so the accepted age is passed with every lookup
+            return cached_request(self.cache, message_type, self.client, chunk, start_date, end_date,
+                                  settings.timeout, run.windows, settings.cache_ttl * 3600, window_workers)
+
+        # While the circuit breaker is open, refused chunks wait for it, up to breaker_wait seconds in all
+        breaker = self.client.circuit_breaker
+        wait_ready = breaker.wait_ready if breaker is not None else None
+
+        start = time.perf_counter()
+        run.results = fetch_adaptive(fetch, run.remaining, settings.max_workers, run.sizer, record, wait_ready,
+                                     settings.breaker_wait)
+        run.elapsed = time.perf_counter() - start
+        # Counted per chunk, the cache itself is shared with other sessions and identities
+        metrics = [result.metrics for result in run.results if result.metrics is not None]
+        run.cache_hits = sum(m.cache_hits for m in metrics)
+        run.cache_misses = sum(m.cache_misses for m in metrics)
+        run.payload_paths = ledger.payload_paths(job)
+        return run
+
+    def run_all(self, message_type, usage_points, start_date="", end_date="", on_start=None, on_result=None):
+        """
+        Like run, but 'Since last retrieval' becomes one 'Specify date' run per start day,
+        so each chunk shares the same window. Returns the list of runs.
+        """
+        if message_type != 'Since last retrieval':
+            return [self.run(message_type, usage_points, start_date, end_date, on_start, on_result)]
+
+        end_date = date.today()
+        groups = self.watermarks.plan(self.client.identity, usage_points, start_date)
+        return [
+            self.run('Specify date', group_points, group_start, end_date, on_start, on_result)
+            for group_start, group_points in groups.items()
+        ]
+
+
+def run_identities(retrievers, message_type, usage_points, start_date="", end_date="", on_start=None,
+                   on_result=None):
+    """
+    Run the retrievals of several identities at the same time, each with its own client, concurrency
+    and rate limit. retrievers and usage_points are keyed by identity; the callbacks are called from
+    the thread of each identity. Returns the runs of all identities.
+    """
+    identities = [identity for identity in retrievers if usage_points.get(identity)]
+    if len(identities) == 1:
+        identity = identities[0]
+        return retrievers[identity].run_all(message_type, usage_points[identity], start_date, end_date, on_start,
+                                            on_result)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(identities)), thread_name_prefix="identity") as executor:
+        futures = [
+            executor.submit(retrievers[identity].run_all, message_type, usage_points[identity], start_date, end_date,
+                            on_start, on_result)
+            for identity in identities
+        ]
+        return [run for future in futures for run in future.result()]
+
+
+def retrieval_task(job, retrievers, message_type, usage_points, start_date="", end_date="", export_dir=None):
+    """
+    Background job body: run the retrieval, report progress and ETA on the job and write the finished
+    ZIP, distribution workbooks and columnar table next to the ledger. Returns the runs and the output paths;
+    the outputs are deleted with the job.
+    retrievers and usage_points are keyed by identity; the retrievers share their outputs.
+    """
+    done = {}
+    fetched = {}
+    start = time.perf_counter()
+    total = max(1, sum(len(points) for points in usage_points.values()))
+    retriever = next(iter(retrievers.values()))
+
+    def on_start(run):
+        done[run.job] = run.resumed
+        job.update(sum(done.values()) / total, f"Retrieving {len(run.remaining)} usage points")
+
+    def on_result(run, result, done_run, total_run):
+        done[run.job] = run.resumed + done_run
+        fetched[run.job] = done_run
+        waiting = sum(r.client.rate_limiter.status["queue_depth"] for r in retrievers.values() if r.client.rate_limiter)
+        throughput = sum(fetched.values()) / max(time.perf_counter() - start, 1e-6)
+        breakers = [f"{identity} API {r.client.circuit_breaker.state.replace('_', '-')}"
+                    for identity, r in retrievers.items()
+                    if r.client.circuit_breaker is not None and r.client.circuit_breaker.state != "closed"]
+        job.update(sum(done.values()) / total,
+                   f"Retrieved {sum(done.values())} of {total} usage points, {throughput:.1f}/s "
+                   f"(chunk size {run.sizer.size}, {waiting} requests waiting"
+                   + "".join(f", {breaker}" for breaker in breakers) + ")")
+
+    runs = run_identities(retrievers, message_type, usage_points, start_date, end_date, on_start, on_result)
+
+    export_dir = export_dir or os.path.join(DATA_DIR, "exports")
+    os.makedirs(export_dir, exist_ok=True)
+
+    zip_path = None
+    if retriever.zip_builder is not None:
+        zip_path = os.path.join(export_dir, f"{job.id}.zip")
+        job.files.append(zip_path)
+        with retriever.zip_builder.close() as zip_file, open(zip_path, "wb") as f:
+            shutil.copyfileobj(zip_file, f)
+
+    distributions_path = None
+    if retriever.distribution is not None:
+        job.update(1.0, "Merging to distributions")
+        distributions_path = os.path.join(export_dir, f"{job.id}_distributions.zip")
+        job.files.append(distributions_path)
+        with open(distributions_path, "wb") as f:
+            f.write(retriever.distribution.close().getvalue())
+
+    columnar_path = None
+    if retriever.columnar is not None:
+        columnar = retriever.columnar
+        suffix = ".zip" if columnar.partition_by_month else FORMATS[columnar.format]
+        columnar_path = os.path.join(export_dir, f"{job.id}_readings{suffix}")
+        job.files.append(columnar_path)
+        with columnar.close() as table_file, open(columnar_path, "wb") as f:
+            shutil.copyfileobj(table_file, f)
+
+    return {
+        "runs": runs,
+        "payload_paths": [path for run in runs for path in run.payload_paths],
+        "zip_path": zip_path,
+        "distributions_path": distributions_path,
+        "columnar_path": columnar_path,
+        "missing_data": retriever.distribution.missing_data if retriever.distribution is not None else [],
+        "telemetry": [row for run in runs for row in telemetry.chunk_rows(run.identity, run.results)]
+    }
@@ -0,0 +1,143 @@
+import io
+import csv
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+
+_local = threading.local()
+
+LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+@dataclass
+class ChunkMetrics:
+    usage_points: int = 0
+    url_bytes: int = 0
+    requests: int = 0
+    status: int = 0
+    ttfb: float = 0.0
+    response_bytes: int = 0
+    meter_readings: int = 0
+    retries: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    coalesced: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def set(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                setattr(self, name, value)
+
+
+def current():
+    return getattr(_local, "metrics", None)
+
+
+@contextmanager
+def collecting(metrics):
+    """Collect what the requests made by this thread report into metrics."""
+    previous = current()
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+
+
+def add(**values):
+    metrics = current()
+    if metrics is not None:
+        metrics.add(**values)
+
+
+def record(**values):
+    metrics = current()
+    if metrics is not None:
+        metrics.set(**values)
+
+
+def chunk_rows(identity, results):
+    """One row per chunk with its metrics, for display and export."""
+    rows = []
+    for result in results:
+        metrics = result.metrics or ChunkMetrics()
+        row = {
+            "identity": identity,
+            "chunk": result.index + 1,
+            "first_usage_point": result.usage_points[0] if result.usage_points else "",
+            # Usage points are written as <distribution>-<number>
+            "distribution": result.usage_points[0].split("-")[0] if result.usage_points else "",
+            "started": datetime.fromtimestamp(result.started).isoformat(timespec="seconds"),
+            "ok": result.ok,
+        }
+        row.update({f.name: getattr(metrics, f.name) for f in fields(metrics) if f.name != "lock"})
+        row["ttfb"] = round(metrics.ttfb, 3)
+        row["latency"] = round(result.elapsed, 3)
+        rows.append(row)
+    return rows
+
+
+def to_csv(rows):
+    output = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return output.getvalue()
+
+
+def to_prometheus(rows):
+    """Prometheus text exposition of the chunk metrics, by identity and distribution."""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["identity"], row["distribution"]), []).append(row)
+
+    lines = [
+        "# HELP meter_readings_chunk_latency_seconds Total latency of a retrieved chunk.",
+        "# TYPE meter_readings_chunk_latency_seconds histogram",
+    ]
+    for (identity, distribution), group in groups.items():
+        labels = f'identity="{identity}",distribution="{distribution}"'
+        for bucket in LATENCY_BUCKETS:
+            count = sum(1 for row in group if row["latency"] <= bucket)
+            lines.append(f'meter_readings_chunk_latency_seconds_bucket{{{labels},le="{bucket}"}} {count}')
+        lines.append(f'meter_readings_chunk_latency_seconds_bucket{{{labels},le="+Inf"}} {len(group)}')
+        lines.append(f'meter_readings_chunk_latency_seconds_sum{{{labels}}} {sum(row["latency"] for row in group):.3f}')
+        lines.append(f'meter_readings_chunk_latency_seconds_count{{{labels}}} {len(group)}')
+
+    counters = [
+        ("ttfb", "meter_readings_time_to_first_byte_seconds_total", "Summed time to first byte."),
+        ("requests", "meter_readings_requests_total", "Requests sent to the API."),
+        ("response_bytes", "meter_readings_response_bytes_total", "Bytes of response bodies."),
+        ("meter_readings", "meter_readings_meter_readings_total", "Meter readings received."),
+        ("retries", "meter_readings_retries_total", "Retried requests and chunk splits."),
+        ("cache_hits", "meter_readings_cache_hits_total", "Usage points served from the cache."),
+        ("cache_misses", "meter_readings_cache_misses_total", "Usage points not found in the cache."),
+        ("coalesced", "meter_readings_coalesced_total", "Usage points shared from a request of another session."),
+        ("url_bytes", "meter_readings_url_bytes_total", "Bytes of request URLs."),
+    ]
+    for column, name, description in counters:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+        for (identity, distribution), group in groups.items():
+            labels = f'identity="{identity}",distribution="{distribution}"'
+            lines.append(f"{name}{{{labels}}} {sum(row[column] for row in group)}")
+
+    lines.append("# HELP meter_readings_chunks_total Finished chunks by HTTP status.")
+    lines.append("# TYPE meter_readings_chunks_total counter")
+    statuses = {}
+    for row in rows:
+        key = (row["identity"], row["distribution"], row["status"])
+        statuses[key] = statuses.get(key, 0) + 1
+    for (identity, distribution, status), count in statuses.items():
+        lines.append(f'meter_readings_chunks_total{{identity="{identity}",distribution="{distribution}",'
+                     f'status="{status}"}} {count}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,116 @@
+"""
+Drive the retrieval code against the mock API and report throughput, chunk latency and peak memory:
+
+    python load_test.py --points 2000 --chunk-size 50 --workers 8 --type monthly --latency 0.3
+
+Pass --url to test against an already running mock (or another endpoint) instead of an in-process one.
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+from _pages.informatika_client import InformatikaClient
+from _pages.rate_limiter import TokenBucket
+from _pages.circuit_breaker import CircuitBreaker
+from _pages.response_cache import ResponseCache
+from _pages.readings_io import ZipBuilder
+from _pages.job_ledger import JobLedger
+from _pages.watermarks import Watermarks
+from _pages.retrieval_job import RetrievalSettings, Retriever
+from _pages.telemetry import chunk_rows, to_csv, to_prometheus
+from mock_informatika import MockServer, add_config_arguments, config_from_args
+
+MESSAGE_TYPES = {
+    "daily": 'Daily 15 minute',
+    "monthly": 'Monthly 15 minute'
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the meter-readings retrieval")
+    parser.add_argument("--url", help="endpoint to test, default an in-process mock")
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--type", choices=list(MESSAGE_TYPES), default="daily")
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--timeout", type=int, default=30)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--zip", action="store_true", help="also build the ZIP while retrieving")
+    parser.add_argument("--rate", type=float, help="requests per second for the rate limiter, default unlimited")
+    parser.add_argument("--breaker", action="store_true", help="use a circuit breaker (opens for 5 s)")
+    parser.add_argument("--report", help="write the per-chunk timing to this .csv or .prom file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = MockServer(config_from_args(args)).start()
+        url = server.url
+
+    rate_limiter = TokenBucket(args.rate, max(1, int(args.rate))) if args.rate else None
+    circuit_breaker = CircuitBreaker(open_seconds=5.0, slow_seconds=args.timeout / 2) if args.breaker else None
+    client = InformatikaClient("load-test", "NME", pool_size=args.workers, base_url=url, rate_limiter=rate_limiter,
+                               circuit_breaker=circuit_breaker)
+    settings = RetrievalSettings(max_workers=args.workers, chunk_size=args.chunk_size, timeout=args.timeout,
+                                 cache_ttl=0, restart=True, window_months=0, stream=args.stream)
+    usage_points = [f"3-{100000 + i}" for i in range(args.points)]
+    rss_before = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        zip_builder = ZipBuilder() if args.zip else None
+        retriever = Retriever(client, JobLedger(data_dir), Watermarks(data_dir), ResponseCache(), settings,
+                              zip_builder)
+
+        start = time.perf_counter()
+        run = retriever.run(MESSAGE_TYPES[args.type], usage_points)
+        if zip_builder is not None:
+            zip_builder.close().close()
+        elapsed = time.perf_counter() - start
+        stored = sum(os.path.getsize(path) for path in run.payload_paths)
+
+    if server is not None:
+        server.stop()
+
+    latencies = sorted(result.elapsed for result in run.results if result.ok)
+    failed = sum(len(result.usage_points) for result in run.failed)
+    print(f"usage points      {len(usage_points)} ({failed} failed)")
+    print(f"chunks            {len(run.results)} (final chunk size {run.sizer.size})")
+    print(f"wall time         {elapsed:.2f} s")
+    print(f"throughput        {(len(usage_points) - failed) / elapsed:.1f} usage points/s, "
+          f"{len(run.results) / elapsed:.2f} chunks/s")
+    print(f"chunk latency     p50 {percentile(latencies, 50):.3f} s, p95 {percentile(latencies, 95):.3f} s, "
+          f"p99 {percentile(latencies, 99):.3f} s")
+    print(f"stored payloads   {stored / 1024 / 1024:.1f} MB (gzip)")
+    print(f"peak memory       {peak_rss_mb():.0f} MB RSS ({peak_rss_mb() - rss_before:.0f} MB during the run)")
+
+    rows = chunk_rows(client.identity, run.results)
+    ttfbs = sorted(row["ttfb"] for row in rows if row["ok"])
+    print(f"time to 1st byte  p50 {percentile(ttfbs, 50):.3f} s, p95 {percentile(ttfbs, 95):.3f} s")
+    print(f"retries           {sum(row['retries'] for row in rows)}")
+    if circuit_breaker is not None:
+        print(f"circuit breaker   {circuit_breaker.status['state']}, tripped {circuit_breaker.trips} times")
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(to_prometheus(rows) if args.report.endswith(".prom") else to_csv(rows))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
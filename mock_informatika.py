@@ -0,0 +1,199 @@
+"""
+Local stand-in for the informatika meter-readings endpoint, for measuring retrieval without production:
+
+    python mock_informatika.py --port 8765 --latency 0.2 --error-rate 0.02
+
+then point the retrieval at http://127.0.0.1:8765/enotna-vstopna-tocka/merilni-podatki/meter-readings
+(retrieve_cli.py --base-url ...). load_test.py starts it in-process.
+"""
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PATH = "/enotna-vstopna-tocka/merilni-podatki/meter-readings"
+TIMEZONE = ZoneInfo("Europe/Ljubljana")
+
+READING_TYPES = [
+    "0.0.2.4.1.2.12.0.0.0.0.0.0.0.0.3.72.0",
+    "0.0.2.4.19.2.12.0.0.0.0.0.0.0.0.3.72.0"
+]
+
+QUALITY_CODES = ["3.8.0", "3.5.259", "1.2.32"]
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.05
+    latency_per_point: float = 0.002
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    timeout_rate: float = 0.0
+    hang_seconds: float = 300.0
+    reading_types: int = 2
+    quality_rate: float = 0.01
+    interval_minutes: int = 15
+
+
+def window(query):
+    """Local [start, end) of a request, like the real API: yesterday, last month or the given dates."""
+    today = date.today()
+    message_type = query.get("messageType", [""])[0]
+    if message_type == "D1_15MIN":
+        start, end = today - timedelta(days=1), today
+    elif message_type == "M1_15MIN":
+        end = today.replace(day=1)
+        start = (end - timedelta(days=1)).replace(day=1)
+    else:
+        start = date.fromisoformat(query["startTime"][0][:10])
+        end = max(date.fromisoformat(query["endTime"][0][:10]), start + timedelta(days=1))
+    return start, end
+
+
+@lru_cache(maxsize=32)
+def timestamps(start, end, interval_minutes):
+    # Step in UTC so the DST changes give 92/100 intervals like the real data
+    step = timedelta(minutes=interval_minutes)
+    current = datetime.combine(start, datetime.min.time(), TIMEZONE).astimezone(ZoneInfo("UTC")) + step
+    last = datetime.combine(end, datetime.min.time(), TIMEZONE).astimezone(ZoneInfo("UTC"))
+    result = []
+    while current <= last:
+        result.append(current.astimezone(TIMEZONE).isoformat())
+        current += step
+    return tuple(result)
+
+
+def meter_reading_json(usage_point, message_type, start, end, config):
+    rng = random.Random(f"{usage_point}{start}")
+    blocks = []
+    for reading_type in READING_TYPES[:config.reading_types]:
+        readings = []
+        for timestamp in timestamps(start, end, config.interval_minutes):
+            qualities = ""
+            if rng.random() < config.quality_rate:
+                qualities = f'{{"readingQualityType":"{rng.choice(QUALITY_CODES)}"}}'
+            readings.append(f'{{"timestamp":"{timestamp}","value":{rng.random() * 10:.3f},'
+                            f'"readingQualities":[{qualities}]}}')
+        blocks.append(f'{{"readingType":"{reading_type}","intervalReadings":[{",".join(readings)}]}}')
+
+    created = datetime.now(TIMEZONE).isoformat()
+    return (f'{{"messageType":"{message_type}","usagePoint":{json.dumps(usage_point)},'
+            f'"messageCreated":"{created}","deviceId":"{usage_point}-dev",'
+            f'"intervalBlocks":[{",".join(blocks)}]}}')
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    config = MockConfig()
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != PATH:
+            return self.send_body(404, b'{"error":"Not found"}')
+
+        query = parse_qs(url.query)
+        usage_points = query.get("usagePoints", [])
+        config = self.config
+
+        roll = random.random()
+        if roll < config.timeout_rate:
+            time.sleep(config.hang_seconds)
+        elif roll < config.timeout_rate + config.throttle_rate:
+            return self.send_body(429, b'{"error":"Too many requests"}', {"Retry-After": "1"})
+        elif roll < config.timeout_rate + config.throttle_rate + config.error_rate:
+            return self.send_body(503, b'{"error":"Service unavailable"}')
+
+        time.sleep(config.latency + config.latency_per_point * len(usage_points))
+
+        start, end = window(query)
+        message_type = query.get("messageType", ["15MIN"])[0]
+        readings = ",".join(meter_reading_json(point, message_type, start, end, config) for point in usage_points)
+        self.send_body(200, f'{{"meterReadings":[{readings}]}}'.encode())
+
+    def send_body(self, status, body, headers=None):
+        compress = "gzip" in self.headers.get("Accept-Encoding", "")
+        if compress:
+            body = gzip.compress(body, 1)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer:
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{PATH}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per request")
+    parser.add_argument("--latency-per-point", type=float, default=0.002, help="extra seconds per usage point")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests that hang")
+    parser.add_argument("--hang-seconds", type=float, default=300.0)
+    parser.add_argument("--reading-types", type=int, default=2, choices=[1, 2], help="interval blocks per meter")
+
+
+def config_from_args(args):
+    return MockConfig(
+        latency=args.latency,
+        latency_per_point=args.latency_per_point,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        reading_types=args.reading_types
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock informatika meter-readings API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(config_from_args(args), args.host, args.port)
+    print(f"INFO: Serving {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
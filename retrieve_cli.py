@@ -0,0 +1,159 @@
+"""
+Retrieve meter readings without the Streamlit UI, e.g. from cron:
+
+    python retrieve_cli.py --identity NME --type daily merilne_tocke.xlsx -o meter_readings.zip
+
+Credentials are read from the ENCODED_STRING_NME / ENCODED_STRING_SFA environment variables,
+or else from .streamlit/secrets.toml like in the app.
+Exits with 1 when some usage points could not be retrieved.
+"""
+import os
+import sys
+import time
+import shutil
+import tomllib
+import argparse
+from datetime import date
+from _pages.informatika_client import InformatikaClient, SECRETS, BASE_URL
+from _pages.rate_limiter import get_rate_limiter
+from _pages.circuit_breaker import get_circuit_breaker
+from _pages.response_cache import ResponseCache
+from _pages.readings_io import get_json, ZipBuilder
+from _pages.job_ledger import JobLedger
+from _pages.distribution import DistributionBuilder
+from _pages.columnar import ColumnarBuilder
+from _pages.telemetry import chunk_rows, to_csv, to_prometheus
+from _pages.watermarks import Watermarks
+from _pages.readings_store import ReadingsStore
+from _pages.retrieval import MAX_WORKERS, WINDOW_WORKERS
+from _pages.retrieval_job import RetrievalSettings, Retriever, read_tagged_usage_points, run_identities
+
+OUTPUT_EXTENSIONS = (".zip", ".json", ".parquet", ".arrow")
+
+MESSAGE_TYPES = {
+    "daily": 'Daily 15 minute',
+    "monthly": 'Monthly 15 minute',
+    "range": 'Specify date',
+    "delta": 'Since last retrieval'
+}
+
+
+def get_secret(ceeps_id):
+    name = SECRETS[ceeps_id]
+    if name.upper() in os.environ:
+        return os.environ[name.upper()]
+
+    secrets_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "secrets.toml")
+    if os.path.exists(secrets_path):
+        with open(secrets_path, "rb") as f:
+            secrets = tomllib.load(f)
+        if name in secrets:
+            return secrets[name]
+
+    sys.exit(f"ERROR: No credentials for {ceeps_id}, set {name.upper()} or add {name} to {secrets_path}.")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieve meter readings for the usage points in an xlsx file.")
+    parser.add_argument("usage_points", help="xlsx file with a 'Merilna točka' and an optional 'CEEPS' column")
+    parser.add_argument("-o", "--output", required=True, help="output file, .zip, .json, .parquet or .arrow")
+    parser.add_argument("--partition-by-month", action="store_true",
+                        help="with .parquet or .arrow output, write a directory with one file per month")
+    parser.add_argument("--identity", choices=list(SECRETS), default="NME",
+                        help="identity of the usage points not tagged in a 'CEEPS' column")
+    parser.add_argument("--type", choices=list(MESSAGE_TYPES), default="daily")
+    parser.add_argument("--start", type=date.fromisoformat, help="start date for range, first date for delta")
+    parser.add_argument("--end", type=date.fromisoformat, help="end date for range")
+    parser.add_argument("--workers", type=int, help="concurrent requests (default per identity)")
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--timeout", type=int, default=120)
+    parser.add_argument("--window-months", type=int, default=1)
+    parser.add_argument("--zip-level", type=int, default=6)
+    parser.add_argument("--stream", action="store_true", help="low memory mode")
+    parser.add_argument("--base-url", default=BASE_URL, help="meter-readings endpoint")
+    parser.add_argument("--restart", action="store_true", help="ignore progress of an earlier run of the same job")
+    parser.add_argument("--mt-dist", help="mt_dist xlsx, also merge the readings into distribution workbooks")
+    parser.add_argument("--distributions", default="files.zip", help="output ZIP of the distribution workbooks")
+    parser.add_argument("--no-store", action="store_true", help="do not append the readings to the local store")
+    parser.add_argument("--metrics", help="write the per-chunk timing to this .csv or .prom (Prometheus text) file")
+    args = parser.parse_args(argv)
+
+    if not args.output.endswith(OUTPUT_EXTENSIONS):
+        parser.error(f"--output must end with {', '.join(OUTPUT_EXTENSIONS)}")
+    if args.type == "range" and (args.start is None or args.end is None):
+        parser.error("--type range needs --start and --end")
+    if args.type == "delta" and args.start is None:
+        parser.error("--type delta needs --start for usage points without earlier data")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    usage_points = read_tagged_usage_points(args.usage_points, args.identity)
+    unknown = [identity for identity in usage_points if identity not in SECRETS]
+    if unknown:
+        sys.exit(f"ERROR: Unknown CEEPS identity {', '.join(unknown)} in {args.usage_points}.")
+
+    zip_builder = ZipBuilder(args.zip_level) if args.output.endswith(".zip") else None
+    columnar = None
+    if args.output.endswith((".parquet", ".arrow")):
+        columnar = ColumnarBuilder(os.path.splitext(args.output)[1][1:], args.partition_by_month)
+    distribution = DistributionBuilder(args.mt_dist) if args.mt_dist else None
+    ledger, watermarks, cache = JobLedger(), Watermarks(), ResponseCache()
+    ledger.purge()
+    store = None if args.no_store else ReadingsStore()
+
+    # The identities run in parallel, each with its own client, concurrency and rate limit
+    retrievers = {}
+    for ceeps_id in usage_points:
+        settings = RetrievalSettings(
+            max_workers=args.workers or MAX_WORKERS[ceeps_id],
+            chunk_size=args.chunk_size,
+            timeout=args.timeout,
+            cache_ttl=0,
+            restart=args.restart,
+            window_months=args.window_months,
+            stream=args.stream
+        )
+        client = InformatikaClient(get_secret(ceeps_id), ceeps_id, pool_size=settings.max_workers * WINDOW_WORKERS,
+                                   base_url=args.base_url, rate_limiter=get_rate_limiter(ceeps_id),
+                                   circuit_breaker=get_circuit_breaker(ceeps_id))
+        retrievers[ceeps_id] = Retriever(client, ledger, watermarks, cache, settings, zip_builder, distribution,
+                                         columnar, store)
+
+    def on_result(run, result, done, total):
+        if not result.ok:
+            print(f"ERROR: {', '.join(result.usage_points)}: {result.error}", file=sys.stderr)
+
+    start = time.perf_counter()
+    runs = run_identities(retrievers, MESSAGE_TYPES[args.type], usage_points, args.start or "", args.end or "",
+                          on_result=on_result)
+    elapsed = time.perf_counter() - start
+
+    payload_paths = [path for run in runs for path in run.payload_paths]
+    if columnar is not None:
+        columnar.write(args.output)
+    else:
+        output = zip_builder.close() if zip_builder is not None else get_json(payload_paths)
+        with output, open(args.output, "wb") as f:
+            shutil.copyfileobj(output, f)
+
+    if distribution is not None:
+        with open(args.distributions, "wb") as f:
+            f.write(distribution.close().getvalue())
+        for usage_point in distribution.missing_data:
+            print(f"INFO: Missing data for {usage_point}.")
+
+    if args.metrics:
+        rows = [row for run in runs for row in chunk_rows(run.identity, run.results)]
+        with open(args.metrics, "w") as f:
+            f.write(to_prometheus(rows) if args.metrics.endswith(".prom") else to_csv(rows))
+
+    failed = sum(len(result.usage_points) for run in runs for result in run.failed)
+    count = sum(len(points) for points in usage_points.values())
+    print(f"INFO: Retrieved {count - failed} of {count} usage points in {elapsed:.1f} s to {args.output}.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
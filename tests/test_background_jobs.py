@@ -0,0 +1,37 @@
+import time
+from _pages.background_jobs import JobManager
+
+
+def wait_for(job):
+    deadline = time.monotonic() + 5
+    while job.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not job.active
+
+
+def test_result_error_and_finished():
+    manager = JobManager(max_workers=2)
+    done = manager.submit("ok", lambda job: 42)
+    failed = manager.submit("failing", lambda job: 1 / 0)
+    wait_for(done)
+    wait_for(failed)
+    assert (done.status, done.result) == ("done", 42)
+    assert failed.status == "failed" and "division" in failed.error
+    assert done.finished is not None and failed.finished is not None
+
+
+def test_purge_deletes_the_files_of_a_job(tmp_path):
+    manager = JobManager(keep_seconds=0)
+    path = tmp_path / "export.zip"
+
+    def task(job):
+        job.files.append(str(path))
+        path.write_bytes(b"zip")
+
+    job = manager.submit("export", task)
+    wait_for(job)
+    assert path.exists()
+    time.sleep(0.01)
+    manager.submit("next", lambda job: None)
+    assert manager.get(job.id) is None
+    assert not path.exists()
@@ -0,0 +1,42 @@
+import time
+import pytest
+from _pages.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def test_opens_after_failures_and_fails_fast():
+    breaker = CircuitBreaker(window=4, min_requests=2, open_seconds=60)
+    for _ in range(2):
+        assert breaker.before() is False
+        breaker.record(False, 0.1)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+
+def test_single_probe_closes_or_reopens_longer():
+    breaker = CircuitBreaker(window=4, min_requests=2, open_seconds=0.05, max_open_seconds=0.15)
+    for _ in range(2):
+        breaker.before()
+        breaker.record(False, 0.1)
+    time.sleep(0.06)
+
+    assert breaker.before() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.record(False, 0.1)
+    assert breaker.state == "open" and breaker.open_seconds == pytest.approx(0.1)
+
+    assert breaker.wait_ready(1.0)
+    assert breaker.before() is True
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed" and breaker.open_seconds == pytest.approx(0.05)
+
+
+def test_wait_ready_times_out():
+    breaker = CircuitBreaker(window=4, min_requests=2, open_seconds=60)
+    for _ in range(2):
+        breaker.before()
+        breaker.record(False, 0.1)
+    start = time.monotonic()
+    assert not breaker.wait_ready(0.1)
+    assert time.monotonic() - start < 1
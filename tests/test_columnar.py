@@ -0,0 +1,32 @@
+import json
+from datetime import date
+import pytest
+import pandas as pd
+from mock_informatika import MockConfig, meter_reading_json
+from _pages.columnar import ColumnarBuilder, read_readings
+
+
+@pytest.fixture
+def builder():
+    builder = ColumnarBuilder()
+    config = MockConfig(reading_types=1)
+    for usage_point in ("3-1", "3-2"):
+        builder.add_meter_reading(json.loads(meter_reading_json(usage_point, "M1_15MIN", date(2026, 9, 30),
+                                                                date(2026, 10, 2), config)))
+    return builder
+
+
+@pytest.mark.parametrize("partition_by_month", [False, True])
+def test_month_filter_with_and_without_partitions(tmp_path, builder, partition_by_month):
+    builder.partition_by_month = partition_by_month
+    path = builder.write(str(tmp_path / ("readings" if partition_by_month else "readings.parquet")))
+
+    everything = read_readings(path)
+    september = read_readings(path, month="2026-09")
+    october = read_readings(path, month="2026-10", usage_points=["3-1"])
+    assert len(everything) == 2 * 2 * 96
+    assert len(september) == 2 * 96
+    assert len(october) == 96 and set(october["usage_point"]) == {"3-1"}
+    # Timestamps mark the end of an interval, midnight still belongs to September
+    assert september["timestamp"].max() == pd.Timestamp("2026-10-01 00:00", tz="Europe/Ljubljana")
+    assert october["timestamp"].min() == pd.Timestamp("2026-10-01 00:15", tz="Europe/Ljubljana")
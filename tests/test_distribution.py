@@ -0,0 +1,99 @@
+import copy
+import json
+import zipfile
+from io import BytesIO
+from datetime import date
+from unittest.mock import patch
+import pandas as pd
+from mock_informatika import MockConfig, meter_reading_json
+from _pages.distribution import DistributionBuilder, assemble_dist_df, get_dataframes_ceeps_json, \
+    get_dataframes_json_files, get_dataframes_meter_readings, merge_to_dist_dfs, write_distributions
+
+
+def meter_readings(*windows, reading_types=1):
+    config = MockConfig(reading_types=reading_types)
+    return [json.loads(meter_reading_json(usage_point, "M1_15MIN", start, end, config))
+            for usage_point, start, end in windows]
+
+
+def union_assembly(dataframes):
+    # The same frames without their grid slot go through the timestamp union
+    for df in dataframes:
+        df.attrs.pop('first_slot', None)
+    return assemble_dist_df(dataframes)
+
+
+def test_meters_on_the_grid_share_one_index():
+    dataframes = get_dataframes_meter_readings(meter_readings(("3-1", date(2026, 10, 24), date(2026, 10, 27)),
+                                                              ("3-2", date(2026, 10, 24), date(2026, 10, 27))))
+    assert dataframes[0].index is dataframes[1].index
+    assert "first_slot" in dataframes[0].attrs
+
+
+def test_grid_assembly_matches_union_across_dst():
+    windows = (("3-1", date(2026, 10, 24), date(2026, 10, 27)), ("3-2", date(2026, 10, 25), date(2026, 10, 28)))
+    grid = assemble_dist_df(get_dataframes_meter_readings(meter_readings(*windows)))
+    union = union_assembly(get_dataframes_meter_readings(meter_readings(*windows)))
+    assert grid.equals(union)
+
+
+def test_grid_assembly_sums_reading_types_like_union():
+    readings = {reading["usagePoint"]: reading for reading in meter_readings(
+        ("3-1", date(2026, 10, 24), date(2026, 10, 27)), ("3-2", date(2026, 10, 24), date(2026, 10, 27)),
+        reading_types=2)}
+    grid = assemble_dist_df(get_dataframes_ceeps_json(copy.deepcopy(readings)))
+    union = union_assembly(get_dataframes_ceeps_json(readings))
+    assert grid.fillna(0).equals(union.fillna(0))
+
+
+def test_gap_between_meters_adds_no_rows():
+    windows = (("3-1", date(2026, 11, 6), date(2026, 11, 8)), ("3-2", date(2026, 11, 15), date(2026, 11, 17)))
+    grid = assemble_dist_df(get_dataframes_meter_readings(meter_readings(*windows)))
+    union = union_assembly(get_dataframes_meter_readings(meter_readings(*windows)))
+    assert len(grid) == 2 * 2 * 96
+    assert grid.equals(union)
+
+
+def test_builder_matches_the_ceeps_round_trip(tmp_path):
+    windows = [(f"3-{i}", date(2026, 10, 1), date(2026, 10, 3)) for i in range(4)]
+    readings = [json.loads(meter_reading_json(usage_point, "M1_15MIN", start, end, MockConfig(reading_types=2)))
+                for usage_point, start, end in windows]
+    mt_dist = tmp_path / "mt_dist.xlsx"
+    with pd.ExcelWriter(mt_dist) as writer:
+        for sheet, points in (("dobava", ["3-0", "3-1"]), ("odkup", ["3-2", "3-3"]), ("obratovalna_podpora", [])):
+            pd.DataFrame({"merilna_tocka": points, "distribucija": [3] * len(points),
+                          "naziv_placnika": ["P"] * len(points)}).to_excel(writer, sheet_name=sheet, index=False)
+
+    builder = DistributionBuilder(str(mt_dist))
+    builder.add_payload({"meterReadings": copy.deepcopy(readings)})
+    built = read_workbooks(builder.close())
+
+    # What json_dist makes of the per usage point files of the ZIP download
+    dataframes = get_dataframes_ceeps_json({reading["usagePoint"]: reading for reading in readings})
+    round_trip = read_workbooks(write_distributions(*merge_to_dist_dfs(dataframes, str(mt_dist))))
+
+    assert built.keys() == round_trip.keys()
+    for key in built:
+        assert built[key].equals(round_trip[key]), key
+
+
+def read_workbooks(zip_io):
+    with zipfile.ZipFile(zip_io) as zip_file:
+        return {(name, sheet): df for name in zip_file.namelist()
+                for sheet, df in pd.read_excel(BytesIO(zip_file.read(name)), sheet_name=None, header=None).items()}
+
+
+def test_json_files_match_the_sequential_path():
+    readings = meter_readings(*[(f"3-{i}", date(2026, 10, 24), date(2026, 10, 27)) for i in range(6)],
+                              reading_types=2)
+    contents = [json.dumps(reading).encode() for reading in readings]
+    sequential_missing, parallel_missing = [], []
+    sequential = get_dataframes_ceeps_json(dict(enumerate(copy.deepcopy(readings))), sequential_missing)
+    # Uploads this small are parsed inline, a tiny WORKER_MIN_BYTES forces the pool
+    with patch("_pages.distribution.WORKER_MIN_BYTES", 1):
+        parallel = get_dataframes_json_files(contents, "CEEPS", parallel_missing, max_workers=2)
+
+    assert sequential_missing == parallel_missing
+    assert len(sequential) == len(parallel)
+    for expected, df in zip(sequential, parallel):
+        assert df.equals(expected) and df.attrs == expected.attrs
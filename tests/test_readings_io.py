@@ -0,0 +1,31 @@
+import json
+import pytest
+import zipfile
+from datetime import date
+from mock_informatika import MockConfig, meter_reading_json
+from _pages import readings_io
+from _pages.readings_io import ZipBuilder
+
+
+@pytest.mark.parametrize("precompressed", [True, False])
+def test_zip_builder_round_trip(monkeypatch, precompressed):
+    # False is the writestr fallback for Python versions write_precompressed was not checked against
+    monkeypatch.setattr(readings_io, "PRECOMPRESSED_WRITES", precompressed)
+    meter_readings = [json.loads(meter_reading_json(f"3-{i}", "M1_15MIN", date(2026, 10, 1), date(2026, 10, 2),
+                                                    MockConfig())) for i in range(50)]
+    builder = ZipBuilder(level=6, max_workers=4)
+    builder.add_payload({"meterReadings": meter_readings[:25]})
+    builder.add_payload({"meterReadings": meter_readings[25:]})
+
+    with builder.close() as f, zipfile.ZipFile(f) as zip_file:
+        assert zip_file.testzip() is None
+        assert sorted(zip_file.namelist()) == sorted(f"{reading['usagePoint']}.json" for reading in meter_readings)
+        for meter_reading in meter_readings:
+            info = zip_file.getinfo(f"{meter_reading['usagePoint']}.json")
+            assert info.compress_type == zipfile.ZIP_DEFLATED
+            assert json.loads(zip_file.read(info)) == meter_reading
+
+
+def test_zip_builder_empty_archive():
+    with ZipBuilder().close() as f, zipfile.ZipFile(f) as zip_file:
+        assert zip_file.namelist() == []
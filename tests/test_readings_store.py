@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pytest
+from _pages.readings_store import MAX_MAPS, ReadingsStore, to_epoch
+
+START = to_epoch("2026-10-01T00:15:00+02:00")
+STEP = 15 * 60
+
+
+def epochs(first, count):
+    return START + (first + np.arange(count)) * STEP
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ReadingsStore(str(tmp_path))
+
+
+def test_append_and_range(store):
+    store.append("3-1", "A", epochs(0, 96), np.arange(96), np.zeros(96))
+    store.append("3-1", "A", epochs(96, 96), np.arange(96, 192), np.zeros(96))
+    assert store.series() == [("3-1", "A", 192, int(epochs(0, 1)[0]), int(epochs(191, 1)[0]))]
+
+    readings = store.range("3-1")
+    assert np.array_equal(readings.timestamps, epochs(0, 192))
+    assert np.array_equal(readings.values, np.arange(192, dtype=np.float32))
+
+
+def test_range_is_half_open(store):
+    store.append("3-1", "A", epochs(0, 96), np.arange(96), np.zeros(96))
+    a, b = int(epochs(10, 1)[0]), int(epochs(20, 1)[0])
+    readings = store.range("3-1", a, b)
+    assert readings.timestamps[0] == a and readings.timestamps[-1] == b - STEP and len(readings.timestamps) == 10
+    assert len(store.range("3-1", a, a).timestamps) == 0
+    # Naive bounds are local time
+    assert store.range("3-1", "2026-10-01 00:15", "2026-10-01 01:15").timestamps.tolist() == epochs(0, 4).tolist()
+    assert len(store.range("3-9").timestamps) == 0
+
+
+def test_overlapping_append_replaces_and_merges(store):
+    store.append("3-1", "A", epochs(0, 10), np.zeros(10), np.zeros(10))
+    before = store.range("3-1")
+    store.append("3-1", "A", epochs(5, 10), np.ones(10), np.full(10, 2))
+
+    readings = store.range("3-1")
+    assert np.array_equal(readings.timestamps, epochs(0, 15))
+    assert readings.values.tolist() == [0.0] * 5 + [1.0] * 10
+    assert readings.qualities.tolist() == [0] * 5 + [2] * 10
+    # Views of the replaced files stay readable
+    assert before.values.tolist() == [0.0] * 10
+    assert store.series("3-1")[0][2] == 15
+
+
+def test_unsorted_append_keeps_last_per_timestamp(store):
+    store.append("3-1", "A", [epochs(2, 1)[0], epochs(0, 1)[0], epochs(2, 1)[0]], [1, 2, 3], [0, 0, 0])
+    readings = store.range("3-1")
+    assert readings.timestamps.tolist() == [epochs(0, 1)[0], epochs(2, 1)[0]]
+    assert readings.values.tolist() == [2.0, 3.0]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="counts open files through /proc")
+def test_open_files_stay_flat(store):
+    for i in range(MAX_MAPS * 4):
+        store.append(f"3-{i}", "A", epochs(0, 4), np.arange(4), np.zeros(4))
+    open_before = len(os.listdir("/proc/self/fd"))
+    for i in range(MAX_MAPS * 4):
+        assert len(store.range(f"3-{i}").timestamps) == 4
+    assert len(store.maps) == MAX_MAPS
+    assert len(os.listdir("/proc/self/fd")) - open_before <= 3 * MAX_MAPS
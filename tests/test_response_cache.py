@@ -0,0 +1,93 @@
+import threading
+import pytest
+from _pages import telemetry
+from _pages.response_cache import ResponseCache, cached_fetch
+
+
+def meter_reading(usage_point, readings=96):
+    return {"usagePoint": usage_point, "intervalBlocks": [{
+        "readingType": "0.0.2.4.1.2.12.0.0.0.0.0.0.0.0.3.72.0",
+        "intervalReadings": [{"timestamp": f"2026-10-01T00:{i % 60:02d}:00+02:00", "value": i * 0.001}
+                             for i in range(readings)]
+    }]}
+
+
+def test_entries_are_bounded_by_bytes():
+    cache = ResponseCache(max_bytes=20000)
+    for i in range(100):
+        cache.put(("NME", f"3-{i}"), meter_reading(f"3-{i}"))
+    assert 0 < cache.size <= 20000
+    assert sum(len(data) for _, data in cache.entries.values()) == cache.size
+    # The least recently used ones went first
+    assert cache.get(("NME", "3-99")) == meter_reading("3-99")
+    assert cache.get(("NME", "3-0")) is None
+
+
+def test_ttl_is_per_lookup():
+    cache = ResponseCache()
+    cache.put("key", meter_reading("3-1"))
+    assert cache.get("key", ttl=0) is None
+    # A session with the cache switched off does not take it away from the others
+    assert cache.get("key", ttl=3600) == meter_reading("3-1")
+
+
+def test_cached_copies_are_independent():
+    cache = ResponseCache()
+    cache.put("key", meter_reading("3-1"))
+    cache.get("key")["intervalBlocks"].clear()
+    assert cache.get("key") == meter_reading("3-1")
+
+
+def test_claim_coalesces_concurrent_requests():
+    cache = ResponseCache()
+    claimed, waiting = cache.claim(["a", "b"])
+    assert set(claimed) == {"a", "b"} and not waiting
+    claimed_again, waiting_again = cache.claim(["b", "c"])
+    assert set(claimed_again) == {"c"} and set(waiting_again) == {"b"}
+
+    cache.release(claimed, {"a": 1, "b": 2})
+    cache.release(claimed_again, error=RuntimeError("failed"))
+    assert waiting_again["b"].result() == 2
+    with pytest.raises(RuntimeError):
+        claimed_again["c"].result()
+    assert not cache.in_flight
+
+
+def test_cached_fetch_requests_each_usage_point_once():
+    cache = ResponseCache()
+    requested = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch(points):
+        requested.append(points)
+        started.set()
+        release.wait(5)
+        return {"meterReadings": [meter_reading(point) for point in points]}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(
+        cached_fetch(cache, "NME", "Specify date", "2026-10-01", "2026-10-02", ["3-1", "3-2"], fetch)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(
+        cached_fetch(cache, "NME", "Specify date", "2026-10-01", "2026-10-02", ["3-2", "3-3"], fetch)))
+    second.start()
+    release.set()
+    first.join()
+    second.join()
+
+    assert sorted(point for points in requested for point in points) == ["3-1", "3-2", "3-3"]
+    assert all(len(payload["meterReadings"]) == 2 for payload in results)
+
+
+def test_cached_fetch_counts_hits_and_misses_of_the_caller():
+    cache = ResponseCache()
+
+    def fetch(points):
+        return {"meterReadings": [meter_reading(point) for point in points]}
+
+    cached_fetch(cache, "NME", "Specify date", "2026-10-01", "2026-10-02", ["3-1"], fetch)
+    with telemetry.collecting(telemetry.ChunkMetrics()) as metrics:
+        cached_fetch(cache, "NME", "Specify date", "2026-10-01", "2026-10-02", ["3-1", "3-2"], fetch)
+    assert (metrics.cache_hits, metrics.cache_misses) == (1, 1)
@@ -0,0 +1,158 @@
+import time
+from datetime import date
+import threading
+import pytest
+from mock_informatika import MockConfig, MockServer
+from _pages.circuit_breaker import CircuitBreaker, CircuitOpenError
+from _pages.informatika_client import InformatikaClient
+from _pages.rate_limiter import TokenBucket
+from _pages.job_ledger import JobLedger
+from _pages.watermarks import Watermarks
+from _pages.response_cache import ResponseCache
+from _pages.retrieval import ChunkSizer, RetryableError, fetch_adaptive, merge_meter_readings, split_date_range
+from _pages import retrieval_job
+from _pages.retrieval_job import RetrievalSettings, Retriever
+
+USAGE_POINTS = [f"3-{100000 + i}" for i in range(80)]
+
+
+def test_retryable_errors_isolate_the_failing_usage_point():
+    def fetch(chunk):
+        if "3-100017" in chunk:
+            raise RetryableError("Server error 503")
+        return {"meterReadings": [{"usagePoint": point} for point in chunk]}
+
+    results = fetch_adaptive(fetch, USAGE_POINTS, max_workers=4, sizer=ChunkSizer(20, max_size=20))
+    failed = [result for result in results if not result.ok]
+    assert [result.usage_points for result in failed] == [["3-100017"]]
+    assert sum(len(result.usage_points) for result in results) == len(USAGE_POINTS)
+    assert [result.offset for result in results] == sorted(result.offset for result in results)
+
+
+def test_deferred_chunks_give_up_after_defer_timeout():
+    calls = []
+
+    def fetch(chunk):
+        calls.append(chunk)
+        raise CircuitOpenError("API unavailable")
+
+    start = time.monotonic()
+    results = fetch_adaptive(fetch, USAGE_POINTS, max_workers=4, sizer=ChunkSizer(20, max_size=20),
+                             wait_ready=lambda timeout: True, defer_timeout=0.2)
+    assert time.monotonic() - start < 5
+    assert all(not result.ok for result in results)
+    # Refused chunks are never split
+    assert sorted(len(result.usage_points) for result in results) == [20, 20, 20, 20]
+
+
+def test_split_date_range_ends_windows_on_month_starts():
+    assert split_date_range(date(2024, 1, 15), date(2024, 3, 10)) == [
+        (date(2024, 1, 15), date(2024, 2, 1)),
+        (date(2024, 2, 1), date(2024, 3, 1)),
+        (date(2024, 3, 1), date(2024, 3, 10))
+    ]
+    assert split_date_range(date(2024, 11, 1), date(2025, 2, 1), months=2) == [
+        (date(2024, 11, 1), date(2025, 1, 1)),
+        (date(2025, 1, 1), date(2025, 2, 1))
+    ]
+
+
+def test_split_date_range_of_a_single_day():
+    assert split_date_range(date(2024, 1, 31), date(2024, 1, 31)) == [(date(2024, 1, 31), date(2024, 1, 31))]
+
+
+def test_merge_deduplicates_overlapping_windows_and_keeps_block_fields():
+    def payload(*timestamps):
+        readings = [{"timestamp": timestamp, "value": i} for i, timestamp in enumerate(timestamps)]
+        block = {"readingType": "A+", "unit": "kWh", "intervalReadings": readings}
+        return {"meterReadings": [{"usagePoint": "3-100000", "intervalBlocks": [block]}]}
+
+    merged = merge_meter_readings([
+        payload("2024-02-01T00:15:00+01:00", "2024-01-31T23:45:00+01:00", "2024-02-01T00:00:00+01:00"),
+        payload("2024-02-01T00:00:00+01:00", "2024-02-01T00:30:00+01:00")
+    ])
+    [meter_reading] = merged["meterReadings"]
+    [block] = meter_reading["intervalBlocks"]
+    assert block["unit"] == "kWh"
+    assert [reading["timestamp"] for reading in block["intervalReadings"]] == [
+        "2024-01-31T23:45:00+01:00", "2024-02-01T00:00:00+01:00",
+        "2024-02-01T00:15:00+01:00", "2024-02-01T00:30:00+01:00"
+    ]
+    # The first window's reading of a shared timestamp is kept
+    assert block["intervalReadings"][1]["value"] == 2
+
+
+def retrieve(tmp_path, config, breaker, breaker_wait, rate_limiter=None, usage_points=USAGE_POINTS, stream=False):
+    server = MockServer(config).start()
+    try:
+        client = InformatikaClient("test", "NME", base_url=server.url, circuit_breaker=breaker,
+                                   rate_limiter=rate_limiter, max_throttled_retries=2)
+        settings = RetrievalSettings(max_workers=4, chunk_size=20, timeout=10, cache_ttl=0, restart=True,
+                                     window_months=0, breaker_wait=breaker_wait, stream=stream)
+        retriever = Retriever(client, JobLedger(str(tmp_path)), Watermarks(str(tmp_path)), ResponseCache(), settings)
+        start = time.monotonic()
+        run = retriever.run("Daily 15 minute", usage_points)
+        return run, time.monotonic() - start
+    finally:
+        server.stop()
+
+
+def test_api_down_fails_all_usage_points_by_the_breaker_deadline(tmp_path):
+    config = MockConfig(latency=0.0, latency_per_point=0.0, error_rate=1.0)
+    breaker = CircuitBreaker(window=4, min_requests=2, open_seconds=0.05, max_open_seconds=0.2)
+    run, elapsed = retrieve(tmp_path, config, breaker, breaker_wait=1)
+
+    assert sum(len(result.usage_points) for result in run.failed) == len(USAGE_POINTS)
+    assert elapsed < 5
+    # Only the chunks that failed before the breaker opened were split, not one per probe cycle
+    assert len(run.results) < 16
+
+
+def test_api_recovers_while_chunks_wait(tmp_path):
+    config = MockConfig(latency=0.0, latency_per_point=0.0, error_rate=1.0)
+    breaker = CircuitBreaker(window=4, min_requests=2, open_seconds=0.05, max_open_seconds=0.2)
+    threading.Timer(0.5, setattr, (config, "error_rate", 0.0)).start()
+    run, _ = retrieve(tmp_path, config, breaker, breaker_wait=30)
+
+    failed = {point for result in run.failed for point in result.usage_points}
+    assert len(failed) < len(USAGE_POINTS) // 2
+    assert breaker.state == "closed"
+
+
+def test_payloads_are_dropped_once_checkpointed(tmp_path):
+    config = MockConfig(latency=0.0, latency_per_point=0.0)
+    run, _ = retrieve(tmp_path, config, None, breaker_wait=1)
+
+    assert not run.failed
+    assert all(result.payload is None for result in run.results)
+    assert len(run.payload_paths) == len(run.results)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_throttled_chunks_fail_without_splitting(tmp_path, stream):
+    config = MockConfig(latency=0.0, latency_per_point=0.0, throttle_rate=1.0)
+    run, _ = retrieve(tmp_path, config, None, breaker_wait=1, rate_limiter=TokenBucket(100.0, 100),
+                      usage_points=USAGE_POINTS[:8], stream=stream)
+
+    assert [len(result.usage_points) for result in run.results] == [8]
+    assert "429" in run.results[0].error
+    # max_throttled_retries requests, and the chunk size is left alone
+    assert run.results[0].metrics.retries == 1
+    assert run.sizer.size == 20
+
+
+@pytest.mark.parametrize("pool_size, window_workers", [(16, 4), (8, 2), (2, 1)])
+def test_window_fan_out_fits_the_connection_pool(tmp_path, monkeypatch, pool_size, window_workers):
+    fan_outs = []
+
+    def fetch_sharded(fetch_window, usage_points_chunk, windows, max_workers):
+        fan_outs.append(max_workers)
+        return {"meterReadings": [{"usagePoint": point} for point in usage_points_chunk]}
+
+    monkeypatch.setattr(retrieval_job, "fetch_sharded", fetch_sharded)
+    client = InformatikaClient("test", "NME", pool_size=pool_size)
+    settings = RetrievalSettings(max_workers=4, chunk_size=20, cache_ttl=0, restart=True, window_months=1)
+    retriever = Retriever(client, JobLedger(str(tmp_path)), Watermarks(str(tmp_path)), ResponseCache(), settings)
+    run = retriever.run("Specify date", USAGE_POINTS[:20], date(2026, 1, 1), date(2026, 6, 1))
+    assert not run.failed
+    assert fan_outs == [window_workers]